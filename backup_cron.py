@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-# __coconut_hash__ = 0x7333562d
+# __coconut_hash__ = 0xd02578c3
 
 # Compiled with Coconut version 1.4.1 [Ernest Scribbler]
 
@@ -762,37 +762,292 @@ _coconut_MatchError, _coconut_count, _coconut_enumerate, _coconut_makedata, _coc
 
 # Compiled Coconut: -----------------------------------------------------------
 
+from collections import deque
+if _coconut_sys.version_info < (3, 3):
+    from collections import Iterable
+else:
+    from collections.abc import Iterable
+if _coconut_sys.version_info < (3, 3):
+    from collections import Iterator
+else:
+    from collections.abc import Iterator
+if _coconut_sys.version_info < (3, 3):
+    from collections import Sequence
+else:
+    from collections.abc import Sequence
+from contextlib import ExitStack
+from contextlib import contextmanager
+from contextlib import nullcontext
+import fcntl
 from datetime import datetime
-import hashlib
+from datetime import timedelta
+from functools import lru_cache
+from functools import wraps
+import json
 import os
+from os.path import abspath
 from os.path import basename
 from os.path import exists
+from os.path import join
 from os.path import normpath
+import re
+import select
+import shlex
+import signal
+import shutil
+import struct
 import subprocess
 sys = _coconut_sys
-from typing import Sequence
+import threading
+import time
 
-from crontab import CronTab
+# Cron fires `run <job id>` often, so anything a plain sync does not need
+# (python-crontab, ctypes, sqlite3, concurrent.futures, hashlib) is imported
+# where it is used rather than here.
 
 default_out_path = 'output'
 out_path = (lambda _coconut_none_coalesce_item: default_out_path if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_OUTPUT_PATH'))
 debug_mode = (lambda x: int(x))((lambda _coconut_none_coalesce_item: '0' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_DEBUG')))
 cron_slices_str = os.environ.get('BACKUP_CRON_SLICE')
 cron_force = os.environ.get('BACKUP_FORCE')
+stagger_mode = os.environ.get('BACKUP_STAGGER')
+scheduler_mode = (lambda _coconut_none_coalesce_item: 'cron' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_SCHEDULER'))
+max_jobs = (int)((lambda _coconut_none_coalesce_item: '1' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_JOBS')))
+# None: as many as --jobs, since every job also holds a slot on the output's device
+per_device_limit = (lambda x: int(x) if x else None)(os.environ.get('BACKUP_PER_DEVICE'))
+transfer_profile = (lambda _coconut_none_coalesce_item: 'auto' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_TRANSFER_PROFILE'))
+snapshot_mode = os.environ.get('BACKUP_SNAPSHOT')
+snapshot_keep = (lambda _coconut_none_coalesce_item: 'hourly=24,daily=7,weekly=4' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_KEEP'))
+manifest_mode = os.environ.get('BACKUP_MANIFEST')
+overlap_policy = (lambda _coconut_none_coalesce_item: 'skip' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_OVERLAP'))
+overlap_stale_after = (float)((lambda _coconut_none_coalesce_item: '3600' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_STALE_AFTER')))
+textfile_path = os.environ.get('BACKUP_TEXTFILE')
+crontab_file = os.environ.get('BACKUP_CRONTAB')
+watch_mode = os.environ.get('BACKUP_WATCH')
+watch_debounce = (float)((lambda _coconut_none_coalesce_item: '2' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_DEBOUNCE')))
+bwlimit = os.environ.get('BACKUP_BWLIMIT')
+nice_level = (int)((lambda _coconut_none_coalesce_item: '0' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_NICE')))
+ionice_class = os.environ.get('BACKUP_IONICE')
+cgroup_parent = os.environ.get('BACKUP_CGROUP')
+io_max = os.environ.get('BACKUP_IO_MAX')
+memory_max = os.environ.get('BACKUP_MEMORY_MAX')
+shard_count = (int)((lambda _coconut_none_coalesce_item: '1' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_SHARDS')))
+store_backend = (lambda _coconut_none_coalesce_item: 'rsync' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_STORE'))
+verify_mode = os.environ.get('BACKUP_VERIFY')
+batch_mode = os.environ.get('BACKUP_BATCH')
+retry_count = (int)((lambda _coconut_none_coalesce_item: '2' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_RETRIES')))
+retry_delay = (float)((lambda _coconut_none_coalesce_item: '10' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_RETRY_DELAY')))
+profile_path = os.environ.get('BACKUP_PROFILE')
+cprofile_path = os.environ.get('BACKUP_CPROFILE')
+# Chrome trace events of this run while profiling, None otherwise
+trace_events = None
+trace_origin = 0.0
+# rsync filter patterns, colon separated in the environment
+include_patterns = (list)(filter(bool, ((lambda _coconut_none_coalesce_item: '' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_INCLUDE'))).split(':')))
+exclude_patterns = (list)(filter(bool, ((lambda _coconut_none_coalesce_item: '' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_EXCLUDE'))).split(':')))
+# The SSH master connection shared by every rsync of this invocation
+ssh_control_path = None
+config_path = os.environ.get('BACKUP_CONFIG')
+state_dir = (lambda _coconut_none_coalesce_item: join((lambda _coconut_none_coalesce_item: os.path.expanduser('~/.local/state') if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('XDG_STATE_HOME')), 'backup_cron') if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(os.environ.get('BACKUP_STATE_DIR'))
 
 file_no_ext = lambda x: basename(x).split('.')[0]
 first = lambda y: y[0] if isinstance(y, Sequence) else y
 is_pair = lambda y: True if isinstance(y, Sequence) and len(y) == 2 else False
 is_singleton = lambda y: True if isinstance(y, Sequence) and len(y) == 1 else False
-fingerprint = lambda y: hashlib.sha256(y.encode('utf-8')).hexdigest()
+@_coconut_tco
+def fingerprint(y  # type: str
+    ):
+# type: (...) -> str
+    import hashlib
+    return _coconut_tail_call(hashlib.sha256(y.encode('utf-8')).hexdigest)
+# A job is identified by the rsync command it runs
+job_id = lambda rsync_args: fingerprint(" ".join(rsync_args))
+# The bare rsync the crontab ran before entries went through this script; its fingerprint was the entry's comment
+legacy_command = lambda rsync_args: " ".join(["rsync", "-avz"] + rsync_args[-2:])
+
+# Only the last lines of rsync output are kept for error reports
+output_tail_lines = 50
+# rsync exits that another attempt may get past: socket, file and stream I/O
+# errors, timeouts, and ssh failing (255)
+retryable_exit_codes = _coconut.set((10, 11, 12, 30, 35, 255))
+# A partial transfer (23) is mostly a missing file or a permission, which stays
+# that way, so it is only retried when rsync blamed I/O or a timeout
+transient_error_re = re.compile(r'Input/output error|timed out|Connection reset|Broken pipe|Resource temporarily unavailable|Stale file handle|read errors mapping')
+# Longest wait between two attempts, however many retries came before
+retry_max_delay = 600
+# Where rsync keeps interrupted files, inside each destination directory, for the next attempt to resume from
+partial_dir_name = '.rsync-partial'
+# Paths in rsync error messages are double quoted
+rsync_quoted_re = re.compile(r'"([^"]*)"')
+rsync_progress_re = re.compile(r'^\s*([\d,]+)\s+(\d+)%\s+(\S+/s)\s+(\d+:\d\d:\d\d)')
+rsync_stat_re = re.compile(r'^(Number of [\w ]+?|Total [\w ]+?|Literal data|Matched data|File list [\w ]+?): ([\d,.]+)')
+rsync_speedup_re = re.compile(r'^total size is [\d,]+\s+speedup is ([\d,.]+)')
+# What rsync --debug=FILTER prints for each entry an exclude rule leaves out
+rsync_hidden_re = re.compile(r'^\[sender\] hiding (?:file|directory) (.+?) because of pattern ')
+# Per-directory exclude patterns, read by rsync and by our own tree walks
+ignore_file_name = '.backupignore'
+rsync_message_prefixes = ('sending incremental file list', 'receiving incremental file list', 'building file list', 'created directory', 'sent ', 'total size is', 'rsync:', 'rsync error:', 'rsync warning:',)
+
+network_fs_types = _coconut.set(('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'sshfs', 'glusterfs', 'fuse.glusterfs', 'ceph', 'fuse.ceph', '9p', 'afs', 'lustre',))
+# host:path, user@host:path, ssh://[user@]host[:port]/path, host::module or rsync://host/module
+is_remote = lambda y: y.startswith('rsync://') or re.match(r'^[^/:]+:', y) is not None
+ssh_url_re = re.compile(r'^ssh://([^/:]+)(?::(\d+))?(/.*)?$')
+# How long an idle SSH master outlives its invocation, should closing it fail
+ssh_control_persist = '60'
+
+# Snapshot directories sort chronologically by name
+snapshot_format = '%Y-%m-%dT%H%M%SZ'
+snapshot_name_re = re.compile(r'^\d{4}-\d\d-\d\dT\d{6}Z$')
+snapshot_partial_suffix = '.partial'
+snapshot_expired_prefix = '.expired-'
+retention_buckets = {'hourly': '%Y%m%d%H', 'daily': '%Y%m%d', 'weekly': '%G%V', 'monthly': '%Y%m'}
+
+# Content-addressed store kept under the output directory by the dedup backend
+store_backends = ('rsync', 'dedup')
+dedup_dir_name = '.dedup'
+# Content-defined chunking: a chunk ends where the gear hash has its top bits
+# clear, giving chunks of about 1 MiB between the minimum and maximum sizes
+chunk_min_size = 256 * 1024
+chunk_max_size = 4 * 1024 * 1024
+chunk_mask = ((1 << 20) - 1) << 44
+# The gear hash only remembers its last 64 bytes, so candidate cuts can be
+# found in segments by separate processes and the chunks picked afterwards
+chunk_window = 64
+chunk_scan_segment = 16 * 1024 * 1024
+
+# Manifest record: size, mtime_ns, inode, path length, then the path bytes
+manifest_record = struct.Struct('<qqQI')
+
+# inotify(7)
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+watch_mask = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+inotify_event = struct.Struct('iIII')
+# Changed entries held per job before giving up and doing a full sync of it
+watch_queue_limit = 4096
+# Keep syncing at least this many debounce periods apart under constant churn
+watch_max_delay_factor = 10
+
+# Cron shorthands, spelled out so their start minute can be staggered
+cron_specials = {'@hourly': '0 * * * *', '@daily': '0 0 * * *', '@midnight': '0 0 * * *', '@weekly': '0 0 * * 0', '@monthly': '0 0 1 * *', '@yearly': '0 0 1 1 *', '@annually': '0 0 1 1 *'}
+
+overlap_policies = ('skip', 'queue', 'kill')
+# Who starts registered jobs: a crontab line each, or the `daemon` subcommand
+schedulers = ('cron', 'daemon')
+# How often the daemon reaps finished jobs and checks the clock
+daemon_poll_seconds = 1
+# Missed minutes the daemon still fires after being suspended
+daemon_catch_up_minutes = 60
+# Expected seconds a job without a successful run takes, for the dispatch order
+daemon_default_cost = 60
+ionice_classes = {'realtime': '1', 'best-effort': '2', 'idle': '3'}
+# How long a killed run gets to exit before SIGKILL
+kill_grace_seconds = 10
+
+history_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+  id INTEGER PRIMARY KEY,
+  job TEXT NOT NULL,
+  path TEXT NOT NULL,
+  started REAL NOT NULL,
+  finished REAL NOT NULL,
+  exit_code INTEGER NOT NULL,
+  files_scanned INTEGER,
+  files_transferred INTEGER,
+  bytes_transferred INTEGER,
+  bytes_sent INTEGER,
+  bytes_received INTEGER,
+  speedup REAL
+);
+CREATE INDEX IF NOT EXISTS runs_job_started ON runs (job, started);
+CREATE TABLE IF NOT EXISTS checksums (
+  dev INTEGER NOT NULL,
+  inode INTEGER NOT NULL,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  digest TEXT NOT NULL,
+  PRIMARY KEY (dev, inode)
+);
+"""
+# Columns added after the first release of the history table
+history_migrations = {'output': 'ALTER TABLE runs ADD COLUMN output TEXT', 'destination': 'ALTER TABLE runs ADD COLUMN destination TEXT', 'entries_skipped': 'ALTER TABLE runs ADD COLUMN entries_skipped INTEGER', 'bytes_skipped': 'ALTER TABLE runs ADD COLUMN bytes_skipped INTEGER'}
+
+prometheus_metrics = (('backup_cron_last_success_timestamp_seconds', 'gauge', 'Unix time the job last finished successfully.'), ('backup_cron_last_duration_seconds', 'gauge', 'Duration of the most recent run.'), ('backup_cron_last_bytes_transferred', 'gauge', 'Bytes of file data transferred by the most recent run.'), ('backup_cron_last_files_transferred', 'gauge', 'Regular files transferred by the most recent run.'), ('backup_cron_runs_total', 'counter', 'Runs recorded for the job.'), ('backup_cron_failures_total', 'counter', 'Runs that exited non-zero.'),)
+
+# Files at least this big are hashed through mmap rather than read()
+verify_mmap_threshold = 1024 * 1024
+# File pairs in flight at once while verifying, bounding memory on huge trees
+verify_window = 1024
+# Digests written per transaction, so history writes of running jobs are not locked out for the whole verify
+verify_commit_rows = 256
+
+# Runs per window when comparing recent history against the one before it
+history_trend_window = 10
+history_list_limit = 50
+# Recent runs into a destination whose throughput predicts an estimate
+throughput_window = 20
+
+# Globals a registered job carries into its `run`
+job_spec_options = ('out_path', 'snapshot_mode', 'snapshot_keep', 'manifest_mode', 'overlap_policy', 'overlap_stale_after', 'textfile_path', 'bwlimit', 'nice_level', 'ionice_class', 'cgroup_parent', 'io_max', 'memory_max', 'shard_count', 'store_backend', 'verify_mode', 'scheduler_mode', 'retry_count', 'retry_delay',)
+
+# Config file keys (top level defaults or per job) and the globals they set
+config_options = {'output': 'out_path', 'transfer_profile': 'transfer_profile', 'snapshot': 'snapshot_mode', 'keep': 'snapshot_keep', 'manifest': 'manifest_mode', 'overlap': 'overlap_policy', 'stale_after': 'overlap_stale_after', 'textfile': 'textfile_path', 'stagger': 'stagger_mode', 'scheduler': 'scheduler_mode', 'bwlimit': 'bwlimit', 'nice': 'nice_level', 'ionice': 'ionice_class', 'cgroup': 'cgroup_parent', 'io_max': 'io_max', 'memory_max': 'memory_max', 'shards': 'shard_count', 'store': 'store_backend', 'verify': 'verify_mode', 'include': 'include_patterns', 'exclude': 'exclude_patterns', 'retries': 'retry_count', 'retry_delay': 'retry_delay'}
 
 def help_content():
     (print)("Usage: {_coconut_format_0}: [options...] <paths>".format(_coconut_format_0=(__file__)))
+    (print)("       {_coconut_format_0}: history [job id prefix]\tShow per-job run trends, or the recent runs of one job".format(_coconut_format_0=(__file__)))
+    (print)("       {_coconut_format_0}: run <job id>\tSync a job registered with --cron (this is what cron runs)".format(_coconut_format_0=(__file__)))
+    (print)("       {_coconut_format_0}: restore <job id prefix> <target dir> [run]\tRebuild a run of a job from the dedup store under --output".format(_coconut_format_0=(__file__)))
+    (print)("       {_coconut_format_0}: estimate [paths...]\tDry-run paths, or every registered job, and predict the bytes and time each sync needs".format(_coconut_format_0=(__file__)))
+    (print)("       {_coconut_format_0}: verify [job id prefix]\tCompare the files of registered jobs with their copies by content".format(_coconut_format_0=(__file__)))
+    (print)("       {_coconut_format_0}: reconcile [config]\tMake the crontab match the jobs in a config file (ENV VAR: BACKUP_CONFIG)".format(_coconut_format_0=(__file__)))
+    (print)("       {_coconut_format_0}: daemon\tStart jobs registered with --scheduler daemon when they are due, --jobs at a time".format(_coconut_format_0=(__file__)))
     (print)("\t-v, --verbose\tEnable debug mode (ENV VAR: BACKUP_DEBUG). -v -v for very verbose.")
     (print)("\t-h, --help\tDisplay this info")
     (print)("\t-o, --output <path>\tThe directory to copy paths to. (ENV VAR: BACKUP_OUTPUT_PATH)")
     (print)("\t-c, --cron <tab definition>\tThe cron 'm h dom mon dow' e.g. '0 * * * *' (ENV VAR: BACKUP_CRON_SLICE)")
     (print)("\t-f, --force\tOverride existing cron job if conflict (ENV VAR: BACKUP_FORCE).")
+    (print)("\t--stagger\tSpread the start minute of jobs sharing a schedule so jobs on the same device do not overlap (ENV VAR: BACKUP_STAGGER).")
+    (print)("\t--scheduler <name>\tcron gives each job a crontab line; daemon leaves them to the daemon subcommand (ENV VAR: BACKUP_SCHEDULER).")
+    (print)("\t--crontab <file>\tRegister jobs in this crontab file instead of the user's crontab (ENV VAR: BACKUP_CRONTAB).")
+    (print)("\t-j, --jobs <n>\tRun up to n rsync processes in parallel (ENV VAR: BACKUP_JOBS).")
+    (print)("\t-b, --batch\tSync file paths that share a destination directory with a single rsync, also when scheduled (ENV VAR: BACKUP_BATCH).")
+    (print)("\t--shards <n>\tSplit each directory into n size-balanced groups of top-level entries, synced by concurrent rsyncs (ENV VAR: BACKUP_SHARDS).")
+    (print)("\t--per-device <n>\tMax concurrent rsyncs touching the same block device, default --jobs (ENV VAR: BACKUP_PER_DEVICE).")
+    (print)("\t--transfer-profile <name>\tauto, local, network, remote or checksum (ENV VAR: BACKUP_TRANSFER_PROFILE).")
+    (print)("\t-s, --snapshot\tWrite each run to a timestamped snapshot hard-linked to the previous one (ENV VAR: BACKUP_SNAPSHOT).")
+    (print)("\t--keep <policy>\tSnapshots to retain e.g. 'hourly=24,daily=7,weekly=4' (ENV VAR: BACKUP_KEEP).")
+    (print)("\t--store <backend>\trsync mirrors each path; dedup keeps every run in a content-addressed chunk store (ENV VAR: BACKUP_STORE).")
+    (print)("\t-m, --manifest\tSkip rsync when nothing changed since the last run, else send only changed files (ENV VAR: BACKUP_MANIFEST).")
+    (print)("\t--verify\tAfter a successful sync compare source and destination files by content (ENV VAR: BACKUP_VERIFY).")
+    (print)("\t--state-dir <path>\tWhere manifests and other run state are kept (ENV VAR: BACKUP_STATE_DIR).")
+    (print)("\t--overlap <policy>\tIf the job is already running: skip, queue (one waiting run) or kill (ENV VAR: BACKUP_OVERLAP).")
+    (print)("\t--stale-after <seconds>\tWith --overlap kill, only kill runs older than this, default 3600 (ENV VAR: BACKUP_STALE_AFTER).")
+    (print)("\t--textfile <path>\tWrite per-job Prometheus metrics here for node_exporter's textfile collector (ENV VAR: BACKUP_TEXTFILE).")
+    (print)("\t--include <pattern>\tKeep entries matching this rsync pattern even if an exclude matches, repeatable (ENV VAR: BACKUP_INCLUDE, colon separated).")
+    (print)("\t--exclude <pattern>\tLeave out entries matching this rsync pattern, repeatable (ENV VAR: BACKUP_EXCLUDE, colon separated).")
+    (print)("\t--retries <n>\tRetry a path whose rsync failed in a way that may pass, up to n times, default 2 (ENV VAR: BACKUP_RETRIES).")
+    (print)("\t--retry-delay <seconds>\tWait before the first retry, doubling for each one after it, default 10 (ENV VAR: BACKUP_RETRY_DELAY).")
+    (print)("\t--bwlimit <rate>\tPassed to rsync --bwlimit e.g. '20M' (ENV VAR: BACKUP_BWLIMIT).")
+    (print)("\t--nice <n>\tRun syncs at this CPU niceness (ENV VAR: BACKUP_NICE).")
+    (print)("\t--ionice <class[:level]>\tI/O scheduling class for syncs: idle, best-effort:0-7 or realtime:0-7 (ENV VAR: BACKUP_IONICE).")
+    (print)("\t--cgroup <path>\tA delegated cgroup v2 directory to run each job in a child cgroup of (ENV VAR: BACKUP_CGROUP).")
+    (print)("\t--io-max <limits>\tio.max limits for each job's cgroup e.g. 'rbps=52428800 wbps=52428800' (ENV VAR: BACKUP_IO_MAX).")
+    (print)("\t--memory-max <bytes>\tmemory.max for each job's cgroup e.g. '512M' (ENV VAR: BACKUP_MEMORY_MAX).")
+    (print)("\t--profile <file>\tWrite a Chrome trace (chrome://tracing, Perfetto) of the run's phases and paths (ENV VAR: BACKUP_PROFILE).")
+    (print)("\t--cprofile <file>\tWrite cProfile stats of the main thread, for pstats or snakeviz (ENV VAR: BACKUP_CPROFILE).")
+    (print)("\t-w, --watch\tAfter the first sync keep watching paths with inotify and sync changes (ENV VAR: BACKUP_WATCH).")
+    (print)("\t--debounce <seconds>\tQuiet time before a watched change is synced, default 2 (ENV VAR: BACKUP_DEBOUNCE).")
     sys.exit(1)
 
 
@@ -826,6 +1081,50 @@ def parse_boolean_args(args  # type: Sequence
             if _coconut_case_check_0:
                 global cron_force
                 cron_force = True
+        if not _coconut_case_check_0:
+            if _coconut_match_to == '--stagger':
+                _coconut_case_check_0 = True
+            if _coconut_case_check_0:
+                global stagger_mode
+                stagger_mode = True
+        if not _coconut_case_check_0:
+            if _coconut_match_to == '-s':
+                _coconut_case_check_0 = True
+            if (not _coconut_case_check_0) and (_coconut_match_to == '--snapshot'):
+                _coconut_case_check_0 = True
+            if _coconut_case_check_0:
+                global snapshot_mode
+                snapshot_mode = True
+        if not _coconut_case_check_0:
+            if _coconut_match_to == '-m':
+                _coconut_case_check_0 = True
+            if (not _coconut_case_check_0) and (_coconut_match_to == '--manifest'):
+                _coconut_case_check_0 = True
+            if _coconut_case_check_0:
+                global manifest_mode
+                manifest_mode = True
+        if not _coconut_case_check_0:
+            if _coconut_match_to == '-b':
+                _coconut_case_check_0 = True
+            if (not _coconut_case_check_0) and (_coconut_match_to == '--batch'):
+                _coconut_case_check_0 = True
+            if _coconut_case_check_0:
+                global batch_mode
+                batch_mode = True
+        if not _coconut_case_check_0:
+            if _coconut_match_to == '--verify':
+                _coconut_case_check_0 = True
+            if _coconut_case_check_0:
+                global verify_mode
+                verify_mode = True
+        if not _coconut_case_check_0:
+            if _coconut_match_to == '-w':
+                _coconut_case_check_0 = True
+            if (not _coconut_case_check_0) and (_coconut_match_to == '--watch'):
+                _coconut_case_check_0 = True
+            if _coconut_case_check_0:
+                global watch_mode
+                watch_mode = True
         if not _coconut_case_check_0:
             clean_args.append(arg)
     return clean_args
@@ -858,6 +1157,181 @@ def parse_arg(arg_pair  # type: Sequence
             global cron_slices_str
             cron_slices_str = value
             return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--crontab":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global crontab_file
+            crontab_file = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "-j":
+            _coconut_case_check_1 = True
+        if (not _coconut_case_check_1) and (_coconut_match_to == "--jobs"):
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global max_jobs
+            max_jobs = int(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--store":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global store_backend
+            store_backend = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--scheduler":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global scheduler_mode
+            scheduler_mode = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--shards":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global shard_count
+            shard_count = int(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--per-device":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global per_device_limit
+            per_device_limit = int(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--transfer-profile":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global transfer_profile
+            transfer_profile = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--keep":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global snapshot_keep
+            snapshot_keep = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--state-dir":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global state_dir
+            state_dir = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--overlap":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global overlap_policy
+            overlap_policy = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--stale-after":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global overlap_stale_after
+            overlap_stale_after = float(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--textfile":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global textfile_path
+            textfile_path = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--debounce":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global watch_debounce
+            watch_debounce = float(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--include":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            include_patterns.append(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--exclude":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            exclude_patterns.append(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--retries":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global retry_count
+            retry_count = int(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--retry-delay":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global retry_delay
+            retry_delay = float(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--profile":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global profile_path
+            profile_path = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--cprofile":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global cprofile_path
+            cprofile_path = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--bwlimit":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global bwlimit
+            bwlimit = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--nice":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global nice_level
+            nice_level = int(value)
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--ionice":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global ionice_class
+            ionice_class = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--cgroup":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global cgroup_parent
+            cgroup_parent = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--io-max":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global io_max
+            io_max = value
+            return True
+    if not _coconut_case_check_1:
+        if _coconut_match_to == "--memory-max":
+            _coconut_case_check_1 = True
+        if _coconut_case_check_1:
+            global memory_max
+            memory_max = value
+            return True
     return False
 
 
@@ -875,59 +1349,2911 @@ def error(s  # type: str
     ):
     return _coconut_tail_call(log, "ERROR: " + s)
 
-def main():
-# Remove file name from args
-    args = (list)((reversed)((list)(takewhile(lambda x: file_no_ext(x) != file_no_ext(__file__), reversed(sys.argv)))))
-# Remove boolean flags from args
-    args = (parse_boolean_args)(args)
-# Group args in pairs, parse args and remove any options from the args
-    paths_to_backup = (list)(filter(lambda x: x if not parse_arg(x) else None, groupsof(2, args)))
-# Flatten (the paths will still be grouped)
-    paths_to_backup = [path for paths in paths_to_backup for path in paths]
 
-# Create the output directory if needed
-    os.path.isdir(out_path) or os.mkdir(out_path)
+def add_trace_event(name,  # type: str
+     start,  # type: float
+     end,  # type: float
+     args  # type: dict
+    ):
+    """Record a complete event, times from time.perf_counter(), on the calling thread's track."""
+    trace_events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(), 'ts': (start - trace_origin) * 1e6, 'dur': (end - start) * 1e6, 'args': args})
 
-    (debug)(*('paths_to_backup: ' + repr(paths_to_backup), 2))
-    (debug)(*('output: {_coconut_format_0}'.format(_coconut_format_0=(out_path)), 2))
-    (debug)(*('force: {_coconut_format_0}'.format(_coconut_format_0=(cron_force)), 2))
-    (debug)(*('cron: {_coconut_format_0}'.format(_coconut_format_0=(cron_slices_str)), 2))
 
-    for path in paths_to_backup:
-        if not exists(path):
-            (error)("{_coconut_format_0} does not exist!".format(_coconut_format_0=(path)))
-            continue
-        if os.path.isdir(path):
-            out_file_name = ((list)(dropwhile(lambda x: len(x) == 0, (reversed)(path.split("/")))))[0]
-        else:
-            out_file_name = basename(path)
-        rsync_args = ["rsync", "-avz", normpath(path), normpath("{_coconut_format_0}/{_coconut_format_1}".format(_coconut_format_0=(out_path), _coconut_format_1=(out_file_name)))]
-        (debug)("EXEC CMD: {_coconut_format_0}".format(_coconut_format_0=(' '.join(rsync_args))))
-        (debug)(subprocess.check_output(rsync_args, stderr=subprocess.STDOUT).decode('utf-8'))
+@contextmanager
+def timed_span(name,  # type: str
+     args  # type: dict
+    ):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_trace_event(name, start, time.perf_counter(), args)
 
-        if cron_slices_str:
-            user_cron = CronTab(user=True)
-            cmd = " ".join(rsync_args)
-            (debug)(*("Existing cron jobs: {_coconut_format_0}".format(_coconut_format_0=(repr(user_cron.crons))), 2))
-# If task already exists
-            try:
-                job = _coconut_igetitem((_coconut.itertools.chain.from_iterable((_coconut_func() for _coconut_func in (lambda: user_cron.find_comment(fingerprint(cmd)), lambda: user_cron.find_command(cmd))))), 0)
-                if job:
-                    if cron_force:
-                        (debug)("Cron job already exists... DELETING {_coconut_format_0})".format(_coconut_format_0=(job.comment)))
-                        user_cron.remove(job)
-                    else:
-                        (error)("Cron job already exists for {_coconut_format_0}!".format(_coconut_format_0=(cmd)))
-                        continue
-            except StopIteration:
-                pass
-            job = (user_cron.new)(**{'command': cmd, 'comment': fingerprint(cmd)})
-            job.setall(cron_slices_str)
-            if not job.is_valid:
-                (error)("Cannot create cron job!: {_coconut_format_0}".format(_coconut_format_0=(repr(job))))
-            else:
-                (debug)("Creating cron job: {_coconut_format_0}".format(_coconut_format_0=(job)))
-                user_cron.write()
+
+# Handed out for every span when not profiling, so a span costs one check
+no_span = nullcontext()
+
+def span(name,  # type: str
+     **args):
+    """A block timed in the --profile trace."""
+    return no_span if trace_events is None else timed_span(name, args)
+
+
+def traced(name  # type: str
+    ):
+    """Time every call of the decorated function as a span, tagged with its first argument if that is a string."""
+    def decorate(f):
+# Not copying f's __dict__: Coconut's tail calls would find the undecorated function there
+        @wraps(f, updated=())
+        @_coconut_tco
+        def call(*args, **kwargs):
+            if trace_events is None:
+                return _coconut_tail_call(f, *args, **kwargs)
+            with timed_span(name, {'target': args[0]} if args and isinstance(args[0], str) else {}):
+                return f(*args, **kwargs)
+        return call
+    return decorate
+
+
+@contextmanager
+def profiling(started  # type: float
+    ):
+    """Trace and cProfile the block as --profile and --cprofile ask, writing both out at the end.
+
+  started is when main() began, so argument handling shows in the trace.
+  cProfile only sees the main thread; worker threads appear in the trace.
+  """
+    global trace_events, trace_origin
+    if not profile_path and not cprofile_path:
+        yield
+        return
+    profiler = None
+    if cprofile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if profile_path:
+        trace_events = []
+        trace_origin = started
+        add_trace_event('parse args', started, time.perf_counter(), {})
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+            (debug)("Wrote cProfile stats to {_coconut_format_0}".format(_coconut_format_0=(cprofile_path)))
+        if profile_path:
+            events = trace_events
+            trace_events = None
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'backup_cron'}})
+            tmp_path = "{_coconut_format_0}.{_coconut_format_1}.tmp".format(_coconut_format_0=(profile_path), _coconut_format_1=(os.getpid()))
+            with open(tmp_path, 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+            os.replace(tmp_path, profile_path)
+            (debug)("Wrote trace of {_coconut_format_0} spans to {_coconut_format_1}".format(_coconut_format_0=(len(events) - 1), _coconut_format_1=(profile_path)))
+
+class SyncResult(_coconut.collections.namedtuple("SyncResult", "path rsync_args returncode output stats errors"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+    def __new__(_cls, path, rsync_args, returncode, output, stats={}, errors=()):
+        return _coconut.tuple.__new__(_cls, (path, rsync_args, returncode, output, stats, errors))
+
+class TransferProfile(_coconut.collections.namedtuple("TransferProfile", "compress whole_file checksum modify_window"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+class FileEvent(_coconut.collections.namedtuple("FileEvent", "name"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+class ProgressEvent(_coconut.collections.namedtuple("ProgressEvent", "transferred percent rate eta"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+class MessageEvent(_coconut.collections.namedtuple("MessageEvent", "text"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+class StatEvent(_coconut.collections.namedtuple("StatEvent", "name value"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+class SkipEvent(_coconut.collections.namedtuple("SkipEvent", "name"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+# A compiled rsync pattern; whole_path ones match the path from the rule's directory, others the last name
+class FilterRule(_coconut.collections.namedtuple("FilterRule", "regex dir_only whole_path"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+# Include and exclude rules as (depth, FilterRule), depth being where the rule's
+# directory sits below the transfer root, whose own name parts are root
+class PathRules(_coconut.collections.namedtuple("PathRules", "root includes excludes"), _coconut.object):
+    __slots__ = ()
+    __ne__ = _coconut.object.__ne__
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and _coconut.tuple.__eq__(self, other)
+    def __hash__(self):
+        return _coconut.tuple.__hash__(self) ^ hash(self.__class__)
+
+
+device_locks = {}
+device_locks_guard = threading.Lock()
+
+def device_key(path  # type: str
+    ):
+# type: (...) -> int
+    """Return the block device of path, or of its nearest existing ancestor."""
+    path = os.path.abspath(path)
+    while not exists(path):
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def device_lock(dev  # type: int
+    ):
+# type: (...) -> threading.BoundedSemaphore
+    """Get the semaphore capping concurrent rsyncs on a device."""
+    with device_locks_guard:
+        if dev not in device_locks:
+            device_locks[dev] = threading.BoundedSemaphore((lambda _coconut_none_coalesce_item: max(max_jobs, 1) if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(per_device_limit))
+        return device_locks[dev]
+
+
+transfer_profiles = {'local': TransferProfile(compress=False, whole_file=True, checksum=False, modify_window=0), 'network': TransferProfile(compress=False, whole_file=True, checksum=False, modify_window=1), 'remote': TransferProfile(compress=True, whole_file=False, checksum=False, modify_window=0), 'checksum': TransferProfile(compress=True, whole_file=False, checksum=True, modify_window=0)}
+
+
+@lru_cache()
+@_coconut_tco
+def mount_table():
+# type: (...) -> list
+    """Return (mount point, fs type) pairs, longest mount point first."""
+    try:
+        with open('/proc/mounts') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) > 2]
+    except OSError:
+        return []
+# /proc/mounts escapes spaces and friends as octal
+    unescape = lambda y: re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), y)
+    return _coconut_tail_call(sorted, [(unescape(point), kind) for point, kind in mounts], key=lambda m: -len(m[0]))
+
+
+def fs_type(path  # type: str
+    ):
+# type: (...) -> str
+    """Return the filesystem type holding path, or its nearest existing ancestor."""
+    path = os.path.abspath(path)
+    while not exists(path):
+        path = os.path.dirname(path)
+    path = os.path.realpath(path)
+    for point, kind in mount_table():
+        if path == point or path.startswith(point.rstrip('/') + '/'):
+            return kind
+    return ''
+
+
+def classify_transfer(src,  # type: str
+     dst  # type: str
+    ):
+# type: (...) -> str
+    """Pick the transfer profile name for a source/destination pair."""
+    if is_remote(src) or is_remote(dst):
+        return 'remote'
+    if fs_type(src) in network_fs_types or fs_type(dst) in network_fs_types:
+        return 'network'
+    return 'local'
+
+
+def profile_flags(profile  # type: TransferProfile
+    ):
+# type: (...) -> list
+    """Translate a transfer profile into rsync flags."""
+    flags = ["-avz" if profile.compress else "-av"]
+    if profile.whole_file:
+        flags.append("--whole-file")
+    if profile.checksum:
+        flags.append("--checksum")
+    if profile.modify_window:
+        flags.append("--modify-window={_coconut_format_0}".format(_coconut_format_0=(profile.modify_window)))
+    return flags
+
+
+def ssh_target(dest  # type: str
+    ):
+# type: (...) -> tuple
+    """Return (host, port, path) for an ssh destination, or None for local and rsync daemon ones."""
+    m = ssh_url_re.match(dest)
+    if m:
+        host, port, remote_path = m.groups()
+        return host, port, (lambda _coconut_none_coalesce_item: '/' if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(remote_path)
+    if dest.startswith('rsync://') or '::' in dest or not is_remote(dest):
+        return None
+    host, _, remote_path = dest.partition(':')
+    return host, None, remote_path or '.'
+
+
+@_coconut_tco
+def rsync_dest(dest  # type: str
+    ):
+# type: (...) -> str
+    """Spell a destination the way rsync takes it (ssh:// URLs become host:path)."""
+    target = ssh_target(dest)
+    if target and dest.startswith('ssh://'):
+        host, _, remote_path = target
+        return _coconut_tail_call("{_coconut_format_0}:{_coconut_format_1}".format, _coconut_format_0=(host), _coconut_format_1=(remote_path))
+    return dest
+
+
+@_coconut_tco
+def ssh_command():
+# type: (...) -> str
+    """The remote shell rsync should use for out_path, going through the shared master if there is one."""
+    _, port, _ = ssh_target(out_path)
+    args = ['ssh'] + (['-p', port] if port else [])
+    if ssh_control_path:
+        args += ['-o', 'ControlPath={_coconut_format_0}'.format(_coconut_format_0=(ssh_control_path)), '-o', 'ControlMaster=auto']
+    return _coconut_tail_call((" ".join), map(shlex.quote, args))
+
+
+@contextmanager
+def remote_session():
+    """Open one SSH master connection for this invocation when out_path is an ssh destination.
+
+  Every rsync (and the remote mkdir) then runs over it, paying for the
+  handshake and authentication once. An rsync daemon needs nothing here.
+  """
+    global ssh_control_path
+    target = ssh_target(out_path)
+    if target is None:
+        yield
+        return
+    import tempfile
+    host, port, _ = target
+    control_dir = tempfile.mkdtemp(prefix='backup_cron-ssh-')
+    control_path = join(control_dir, 'master')
+    port_args = ['-p', port] if port else []
+    start = ['ssh', '-M', '-N', '-f', '-o', 'ControlPath={_coconut_format_0}'.format(_coconut_format_0=(control_path)), '-o', 'ControlPersist={_coconut_format_0}'.format(_coconut_format_0=(ssh_control_persist))] + port_args + [host]
+    (debug)("EXEC CMD: {_coconut_format_0}".format(_coconut_format_0=(' '.join(start))))
+    try:
+        with span('ssh connect', target=host):
+            subprocess.run(start, check=True)
+        ssh_control_path = control_path
+    except (OSError, subprocess.CalledProcessError) as e:
+        (error)("Cannot open an SSH master connection to {_coconut_format_0}, each rsync will connect on its own: {_coconut_format_1}".format(_coconut_format_0=(host), _coconut_format_1=(e)))
+    try:
+        yield
+    finally:
+        if ssh_control_path:
+            subprocess.run(['ssh', '-O', 'exit', '-o', 'ControlPath={_coconut_format_0}'.format(_coconut_format_0=(control_path))] + port_args + [host], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            ssh_control_path = None
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+
+@traced('output dir')
+def make_output_dir():
+# type: (...) -> bool
+    """Create out_path if needed, on the remote end for remote destinations."""
+    if not is_remote(out_path):
+        os.path.isdir(out_path) or os.mkdir(out_path)
+        return True
+    target = ssh_target(out_path)
+    if target:
+        host, _, remote_path = target
+        cmd = shlex.split(ssh_command()) + [host, "mkdir -p -- {_coconut_format_0}".format(_coconut_format_0=(shlex.quote(remote_path)))]
+    else:
+# An rsync daemon has no shell; syncing an empty directory creates the output
+        import tempfile
+        empty = tempfile.mkdtemp(prefix='backup_cron-empty-')
+        cmd = ['rsync', '-r', empty + '/', out_path.rstrip('/') + '/']
+    (debug)("EXEC CMD: {_coconut_format_0}".format(_coconut_format_0=(' '.join(cmd))))
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        (error)("Cannot create {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(out_path), _coconut_format_1=(e)))
+        return False
+    finally:
+        target or os.rmdir(empty)
+
+
+def build_rsync_args(path  # type: str
+    ):
+# type: (...) -> list
+    """Build the rsync command that mirrors path into out_path."""
+    if os.path.isdir(path):
+        out_file_name = ((list)(dropwhile(lambda x: len(x) == 0, (reversed)(path.split("/")))))[0]
+    else:
+        out_file_name = basename(path)
+    dest = "{_coconut_format_0}/{_coconut_format_1}".format(_coconut_format_0=(rsync_dest(out_path).rstrip('/')), _coconut_format_1=(out_file_name)) if is_remote(out_path) else normpath("{_coconut_format_0}/{_coconut_format_1}".format(_coconut_format_0=(out_path), _coconut_format_1=(out_file_name)))
+    profile_name = classify_transfer(path, dest) if transfer_profile == 'auto' else transfer_profile
+    (debug)(*("Transfer profile for {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(path), _coconut_format_1=(profile_name)), 2))
+    return ["rsync"] + profile_flags(transfer_profiles[profile_name]) + filter_args() + [normpath(path), dest]
+
+
+def stream_lines(proc  # type: subprocess.Popen
+    ):
+# type: (...) -> Iterator[str]
+    """Yield rsync output line by line while it runs (progress updates end in \\r)."""
+    for line in proc.stdout:
+        line = line.rstrip('\n')
+        if line:
+            yield line
+
+
+@_coconut_tco
+def parse_rsync_line(line  # type: str
+    ):
+    """Turn one line of rsync output into a progress, message or file event."""
+    m = rsync_progress_re.match(line)
+    if m:
+        transferred, percent, rate, eta = m.groups()
+        return _coconut_tail_call(ProgressEvent, int(transferred.replace(',', '')), int(percent), rate, eta)
+    m = rsync_stat_re.match(line) or rsync_speedup_re.match(line)
+    if m:
+        name, value = m.groups() if len(m.groups()) == 2 else ('speedup', m.group(1))
+        value = value.replace(',', '')
+        return _coconut_tail_call(StatEvent, name.lower().replace(' ', '_'), float(value) if '.' in value else int(value))
+    m = rsync_hidden_re.match(line)
+    if m:
+        return _coconut_tail_call(SkipEvent, m.group(1))
+    if line.startswith(rsync_message_prefixes):
+        return _coconut_tail_call(MessageEvent, line)
+    return _coconut_tail_call(FileEvent, line)
+
+
+def report_event(path,  # type: str
+     event):
+    """Log an rsync event in debug mode."""
+    _coconut_match_to = event
+    _coconut_case_check_2 = False
+    if (_coconut.isinstance(_coconut_match_to, ProgressEvent)) and (_coconut.len(_coconut_match_to) == 4):
+        transferred = _coconut_match_to[0]
+        percent = _coconut_match_to[1]
+        rate = _coconut_match_to[2]
+        eta = _coconut_match_to[3]
+        _coconut_case_check_2 = True
+    if _coconut_case_check_2:
+        (debug)("{_coconut_format_0}: {_coconut_format_1}% {_coconut_format_2} bytes {_coconut_format_3} eta {_coconut_format_4}".format(_coconut_format_0=(path), _coconut_format_1=(percent), _coconut_format_2=(transferred), _coconut_format_3=(rate), _coconut_format_4=(eta)))
+    if not _coconut_case_check_2:
+        if (_coconut.isinstance(_coconut_match_to, MessageEvent)) and (_coconut.len(_coconut_match_to) == 1):
+            text = _coconut_match_to[0]
+            _coconut_case_check_2 = True
+        if _coconut_case_check_2:
+            (debug)("{_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(path), _coconut_format_1=(text)))
+    if not _coconut_case_check_2:
+        if (_coconut.isinstance(_coconut_match_to, StatEvent)) and (_coconut.len(_coconut_match_to) == 2):
+            name = _coconut_match_to[0]
+            value = _coconut_match_to[1]
+            _coconut_case_check_2 = True
+        if _coconut_case_check_2:
+            (debug)(*("{_coconut_format_0}: {_coconut_format_1} = {_coconut_format_2}".format(_coconut_format_0=(path), _coconut_format_1=(name), _coconut_format_2=(value)), 2))
+    if not _coconut_case_check_2:
+        if (_coconut.isinstance(_coconut_match_to, FileEvent)) and (_coconut.len(_coconut_match_to) == 1):
+            name = _coconut_match_to[0]
+            _coconut_case_check_2 = True
+        if _coconut_case_check_2:
+            (debug)(*("{_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(path), _coconut_format_1=(name)), 2))
+    if not _coconut_case_check_2:
+        if (_coconut.isinstance(_coconut_match_to, SkipEvent)) and (_coconut.len(_coconut_match_to) == 1):
+            name = _coconut_match_to[0]
+            _coconut_case_check_2 = True
+        if _coconut_case_check_2:
+            (debug)(*("{_coconut_format_0}: skipped {_coconut_format_1}".format(_coconut_format_0=(path), _coconut_format_1=(name)), 2))
+
+
+def lower_priority():
+    """Apply nice_level and ionice_class to this process.
+
+  Worker threads and the rsyncs they start inherit both, as long as this runs
+  before any of them are created.
+  """
+    if nice_level:
+        os.nice(nice_level)
+    if ionice_class:
+        name, _, level = ionice_class.partition(':')
+        cmd = ['ionice', '-c', ionice_classes[name]] + (['-n', level] if level else []) + ['-p', str(os.getpid())]
+        try:
+            subprocess.run(cmd, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            (error)("Cannot set I/O priority {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(ionice_class), _coconut_format_1=(e)))
+
+
+def whole_disk(dev  # type: int
+    ):
+# type: (...) -> str
+    """Return 'major:minor' of the disk holding a device (io.max only takes whole disks), or None."""
+    sys_path = "/sys/dev/block/{_coconut_format_0}:{_coconut_format_1}".format(_coconut_format_0=(os.major(dev)), _coconut_format_1=(os.minor(dev)))
+    if not exists(sys_path):
+        return None
+    if exists(join(sys_path, 'partition')):
+        sys_path = join(os.path.realpath(sys_path), '..')
+    with open(join(sys_path, 'dev')) as f:
+        return f.read().strip()
+
+
+def write_control(cgroup,  # type: str
+     name,  # type: str
+     value  # type: str
+    ):
+    with open(join(cgroup, name), 'w') as f:
+        f.write(value)
+
+
+def make_cgroup(rsync_args  # type: list
+    ):
+# type: (...) -> str
+    """Create a child of cgroup_parent with the io.max and memory.max limits for one job."""
+    cgroup = join(cgroup_parent, "backup_cron-{_coconut_format_0}-{_coconut_format_1}".format(_coconut_format_0=(os.getpid()), _coconut_format_1=(threading.get_ident())))
+    controllers = (['+io'] if io_max else []) + (['+memory'] if memory_max else [])
+    if controllers:
+        try:
+            write_control(cgroup_parent, 'cgroup.subtree_control', " ".join(controllers))
+        except OSError as e:
+# Already enabled by whoever delegated the parent, or about to fail below
+            (debug)(*("Cannot enable {_coconut_format_0} in {_coconut_format_1}: {_coconut_format_2}".format(_coconut_format_0=(' '.join(controllers)), _coconut_format_1=(cgroup_parent), _coconut_format_2=(e)), 2))
+    os.makedirs(cgroup, exist_ok=True)
+    memory_max and write_control(cgroup, 'memory.max', memory_max)
+    if io_max:
+        disks = _coconut.set((whole_disk(device_key(p)) for p in rsync_args[-2:] if not is_remote(p)))
+        for disk in disks - _coconut.set((None,)):
+            write_control(cgroup, 'io.max', "{_coconut_format_0} {_coconut_format_1}".format(_coconut_format_0=(disk), _coconut_format_1=(io_max)))
+    return cgroup
+
+
+def remove_cgroup(cgroup  # type: str
+    ):
+    try:
+        os.rmdir(cgroup)
+    except OSError as e:
+        (error)("Cannot remove cgroup {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(cgroup), _coconut_format_1=(e)))
+
+
+def split_rate(rate,  # type: str
+     parts  # type: int
+    ):
+# type: (...) -> str
+    """Divide an rsync --bwlimit rate such as '20M' or '1.5m' between concurrent rsyncs."""
+    m = re.match(r'(\d+(?:\.\d*)?)(.*)$', rate)
+    if not m or parts <= 1:
+        return rate
+    value = "{_coconut_format_0:.3f}".format(_coconut_format_0=(float(m.group(1)) / parts)).rstrip('0').rstrip('.')
+    return value + m.group(2)
+
+
+@traced('rsync')
+@_coconut_tco
+def run_rsync(path,  # type: str
+     rsync_args,  # type: list
+     cgroup=None,  # type: str
+     rate=None,  # type: str
+     wanted_error=None):
+# type: (...) -> SyncResult
+    """Run rsync, streaming its output into events.
+
+  cgroup and rate override the job's own cgroup and --bwlimit, for rsyncs
+  sharing them. Only the first output_tail_lines error messages are kept,
+  unless wanted_error picks the ones to keep.
+  """
+# Run-time only flags: stats for the history, live progress when debugging.
+# None of them are part of the job id.
+# .backupignore only excludes, so it can follow the job's own rules
+    exec_args = rsync_args + ['--stats', '--filter=:- {_coconut_format_0}'.format(_coconut_format_0=(ignore_file_name)), '--debug=FILTER', '--partial-dir={_coconut_format_0}'.format(_coconut_format_0=(partial_dir_name))]
+    rate = (bwlimit if rate is None else rate)
+    exec_args += (['--info=progress2'] if debug_mode else []) + (['--bwlimit={_coconut_format_0}'.format(_coconut_format_0=(rate))] if rate else [])
+    if ssh_target(out_path):
+        exec_args.append('--rsh={_coconut_format_0}'.format(_coconut_format_0=(ssh_command())))
+    own_cgroup = None
+    if cgroup is None and cgroup_parent:
+        try:
+            cgroup = own_cgroup = make_cgroup(rsync_args)
+        except OSError as e:
+            return _coconut_tail_call(SyncResult, path, rsync_args, 1, "Cannot set up cgroup under {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(cgroup_parent), _coconut_format_1=(e)))
+    if cgroup:
+# The shell moves itself into the cgroup, then becomes rsync
+        exec_args = ['sh', '-c', 'echo $$ > "$0/cgroup.procs" && exec "$@"', cgroup] + exec_args
+    (debug)("EXEC CMD: {_coconut_format_0}".format(_coconut_format_0=(' '.join(exec_args))))
+    try:
+        proc = subprocess.Popen(exec_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, encoding='utf-8', errors='replace')
+    except OSError as e:
+        own_cgroup and os.rmdir(own_cgroup)
+        return _coconut_tail_call(SyncResult, path, rsync_args, 127, str(e))
+    tail = deque(maxlen=output_tail_lines)
+    stats = {}
+# The first error messages, unlike the tail, so failures can be traced to a path
+    errors = []
+# Names are relative to the transfer root: the directory given with
+# --files-from, else the source itself with a trailing slash, or its parent
+    src = rsync_args[-2]
+    files_from = any((a.startswith('--files-from') for a in rsync_args))
+    base = src if files_from or src.endswith('/') else os.path.dirname(src)
+    entries_skipped = 0
+# Sizing reads the metadata of whole excluded trees, so only when debugging
+    bytes_skipped = 0 if debug_mode else None
+    try:
+        with proc:
+            for line in stream_lines(proc):
+                tail.append(line)
+                event = parse_rsync_line(line)
+                report_event(path, event)
+                _coconut_match_to = event
+                _coconut_case_check_3 = False
+                if (_coconut.isinstance(_coconut_match_to, StatEvent)) and (_coconut.len(_coconut_match_to) == 2):
+                    name = _coconut_match_to[0]
+                    value = _coconut_match_to[1]
+                    _coconut_case_check_3 = True
+                if _coconut_case_check_3:
+                    stats[name] = value
+                if not _coconut_case_check_3:
+                    if (_coconut.isinstance(_coconut_match_to, MessageEvent)) and (_coconut.len(_coconut_match_to) == 1):
+                        text = _coconut_match_to[0]
+                        _coconut_case_check_3 = True
+                    if _coconut_case_check_3 and not (text.startswith('rsync:')):
+                        _coconut_case_check_3 = False
+                    if _coconut_case_check_3:
+                        if wanted_error(text) if wanted_error else len(errors) < output_tail_lines:
+                            errors.append(text)
+                if not _coconut_case_check_3:
+                    if (_coconut.isinstance(_coconut_match_to, SkipEvent)) and (_coconut.len(_coconut_match_to) == 1):
+                        name = _coconut_match_to[0]
+                        _coconut_case_check_3 = True
+                    if _coconut_case_check_3:
+                        entries_skipped += 1
+                        if bytes_skipped is not None:
+                            bytes_skipped += skipped_size(join(base, name))
+    finally:
+        own_cgroup and remove_cgroup(own_cgroup)
+    stats['entries_skipped'] = entries_skipped
+    if bytes_skipped is not None:
+        stats['bytes_skipped'] = bytes_skipped
+    return _coconut_tail_call(SyncResult, path, rsync_args, proc.returncode, '\n'.join(tail), stats, tuple(errors))
+
+
+def parse_retention(spec  # type: str
+    ):
+# type: (...) -> dict
+    """Parse 'hourly=24,daily=7' into {'hourly': 24, 'daily': 7}."""
+    policy = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        period, _, count = part.partition('=')
+        period = period.strip()
+        if period not in retention_buckets:
+            raise ValueError("Unknown retention period {_coconut_format_0!r}".format(_coconut_format_0=(period)))
+        policy[period] = int(count)
+    return policy
+
+
+@_coconut_tco
+def list_snapshots(root  # type: str
+    ):
+# type: (...) -> list
+    """Return the complete snapshot names under root, newest first."""
+    if not os.path.isdir(root):
+        return []
+    with os.scandir(root) as entries:
+        names = [e.name for e in entries if e.is_dir(follow_symlinks=False) and snapshot_name_re.match(e.name)]
+    return _coconut_tail_call(sorted, names, reverse=True)
+
+
+def expired_snapshots(names,  # type: list
+     policy  # type: dict
+    ):
+# type: (...) -> list
+    """Pick the snapshots (newest first) that fall outside the retention policy."""
+# The newest snapshot is always kept, it is the next run's --link-dest
+    kept = set(names[:1])
+    for period, count in policy.items():
+        buckets = set()
+        for name in names:
+            bucket = datetime.strptime(name, snapshot_format).strftime(retention_buckets[period])
+            if bucket in buckets:
+                continue
+            if len(buckets) >= count:
+                break
+            buckets.add(bucket)
+            kept.add(name)
+    return [name for name in names if name not in kept]
+
+
+def prune_snapshots(root,  # type: str
+     policy  # type: dict
+    ):
+    """Delete expired snapshots under root."""
+# Renaming first makes a snapshot disappear atomically; the slow delete can then
+# run in parallel and is picked up again by the next run if it gets interrupted.
+    for name in expired_snapshots(list_snapshots(root), policy):
+        (debug)("Expiring snapshot {_coconut_format_0}".format(_coconut_format_0=(join(root, name))))
+        os.rename(join(root, name), join(root, snapshot_expired_prefix + name))
+    with os.scandir(root) as entries:
+        doomed = [e.path for e in entries if e.name.startswith(snapshot_expired_prefix)]
+    if not doomed:
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(len(doomed), 4)) as pool:
+        (consume)(pool.map(shutil.rmtree, doomed))
+
+
+def update_latest(root,  # type: str
+     name  # type: str
+    ):
+    """Point root/latest at the named snapshot."""
+    tmp_link = join(root, '.latest.tmp')
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(name, tmp_link)
+    os.replace(tmp_link, join(root, 'latest'))
+
+
+@traced('snapshot')
+@_coconut_tco
+def snapshot_sync(path,  # type: str
+     rsync_args  # type: list
+    ):
+# type: (...) -> SyncResult
+    """Sync path into a new timestamped snapshot, hard-linking unchanged files to the last one."""
+    root = rsync_args[-1]
+    os.makedirs(root, exist_ok=True)
+    previous = list_snapshots(root)
+    name = datetime.utcnow().strftime(snapshot_format)
+    partial = join(root, name + snapshot_partial_suffix)
+# Resume into whatever an interrupted run left behind rather than starting over
+    with os.scandir(root) as entries:
+        for stale in [e.path for e in entries if e.name.endswith(snapshot_partial_suffix)]:
+            if not exists(partial):
+                os.rename(stale, partial)
+            else:
+                shutil.rmtree(stale)
+    link_dest = ["--link-dest={_coconut_format_0}".format(_coconut_format_0=(abspath(join(root, previous[0]))))] if previous else []
+    result = transfer(path, rsync_args[:-2] + link_dest + [rsync_args[-2], partial])
+    if result.returncode == 0:
+        os.rename(partial, join(root, name))
+        update_latest(root, name)
+        prune_snapshots(root, parse_retention(snapshot_keep))
+    return _coconut_tail_call(result._replace, rsync_args=rsync_args)
+
+
+def filter_args():
+# type: (...) -> list
+    """rsync --filter rules for include_patterns and exclude_patterns, includes first so they win."""
+    return ['--filter=+ {_coconut_format_0}'.format(_coconut_format_0=(p)) for p in include_patterns] + ['--filter=- {_coconut_format_0}'.format(_coconut_format_0=(p)) for p in exclude_patterns]
+
+
+@_coconut_tco
+def compile_pattern(pattern  # type: str
+    ):
+# type: (...) -> FilterRule
+    """Compile an rsync filter pattern: *, ** and ?, a leading / anchoring it, a trailing / for directories only."""
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = pattern.startswith('/')
+    pattern = pattern.lstrip('/')
+    whole_path = anchored or '/' in pattern or '**' in pattern
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        c = pattern[i]
+        end = pattern.find(']', i + 2) if c == '[' else -1
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif end > 0:
+            regex += '[' + pattern[i + 1:end].replace('\\', '\\\\').replace('!', '^', 1 if pattern[i + 1] == '!' else 0) + ']'
+            i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+# Unanchored path patterns match the trailing components of a path
+    return _coconut_tail_call(FilterRule, re.compile(('^' if anchored or not whole_path else '(?:^|/)') + regex + '$'), dir_only, whole_path)
+
+
+@_coconut_tco
+def path_rules(rsync_args  # type: list
+    ):
+# type: (...) -> PathRules
+    """The include and exclude rules among a job's rsync flags, for walking its source as rsync does."""
+    includes = [(0, compile_pattern(a[len('--filter=+ '):])) for a in rsync_args[1:-2] if a.startswith('--filter=+ ')]
+    excludes = [(0, compile_pattern(a[len('--filter=- '):])) for a in rsync_args[1:-2] if a.startswith('--filter=- ')]
+    return _coconut_tail_call(PathRules, (basename(normpath(rsync_args[-2])),), includes, excludes)
+
+
+@_coconut_tco
+def with_ignore_file(rules,  # type: PathRules
+     top,  # type: str
+     depth  # type: int
+    ):
+# type: (...) -> PathRules
+    """Add the patterns of top's .backupignore to rules."""
+    try:
+        with open(join(top, ignore_file_name)) as f:
+            patterns = [line.strip() for line in f if line.strip() and not line.lstrip().startswith(('#', ';'))]
+    except OSError as e:
+        (error)("Cannot read {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(join(top, ignore_file_name)), _coconut_format_1=(e)))
+        return rules
+    return _coconut_tail_call(rules._replace, excludes=rules.excludes + [(depth, compile_pattern(p)) for p in patterns])
+
+
+@_coconut_tco
+def is_excluded(rules,  # type: PathRules
+     parts,  # type: tuple
+     is_dir  # type: bool
+    ):
+# type: (...) -> bool
+    """Whether the first rule matching the path parts (from the transfer root) excludes it."""
+    def matches(depth, rule):
+# type: (...) -> bool
+        if rule.dir_only and not is_dir:
+            return False
+        return rule.regex.search('/'.join(parts[depth:]) if rule.whole_path else parts[-1]) is not None
+    if any((matches(depth, rule) for depth, rule in rules.includes)):
+        return False
+    return _coconut_tail_call(any, (matches(depth, rule) for depth, rule in rules.excludes))
+
+
+def skipped_size(path  # type: str
+    ):
+# type: (...) -> int
+    """Bytes a filter rule kept out of a sync: a file's size, or everything under a directory."""
+    try:
+        return tree_size(path) if os.path.isdir(path) and not os.path.islink(path) else os.lstat(path).st_size
+    except OSError:
+        return 0
+
+
+def scan_tree(top,  # type: str
+     prefix=(),  # type: tuple
+     rules=None  # type: PathRules
+    ):
+# type: (...) -> Iterator[tuple]
+    """Yield (path parts, size, mtime_ns, inode) for top and everything below it.
+
+  Entries come out in depth-first order with siblings sorted by name, so two
+  scans can be merge-joined by comparing path parts. Only one directory
+  listing is held in memory at a time. With rules, entries rsync would leave
+  out, and everything below them, are skipped.
+  """
+    st = os.lstat(top)
+    yield (prefix, st.st_size, st.st_mtime_ns, st.st_ino)
+    if not os.path.isdir(top) or os.path.islink(top):
+        return
+    try:
+        with os.scandir(top) as it:
+            entries = (sorted)([(e.name, e.is_dir(follow_symlinks=False)) for e in it])
+    except OSError as e:
+        (error)("Cannot scan {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(top), _coconut_format_1=(e)))
+        return
+    if rules is not None and any((name == ignore_file_name for name, _ in entries)):
+        rules = with_ignore_file(rules, top, len(rules.root) + len(prefix))
+    for name, is_dir in entries:
+        if rules is None or not is_excluded(rules, rules.root + prefix + (name,), is_dir):
+            _coconut_yield_from = scan_tree(join(top, name), prefix + (name,), rules)
+            for _coconut_yield_item in _coconut_yield_from:
+                yield _coconut_yield_item
+
+
+
+def read_manifest(manifest_path  # type: str
+    ):
+# type: (...) -> Iterator[tuple]
+    """Stream the rows of a manifest file."""
+    with open(manifest_path, 'rb') as f:
+        while True:
+            header = f.read(manifest_record.size)
+            if len(header) < manifest_record.size:
+                return
+            size, mtime_ns, inode, length = manifest_record.unpack(header)
+            rel = os.fsdecode(f.read(length))
+            yield (tuple(rel.split('/')) if rel else (), size, mtime_ns, inode)
+
+
+def tee_manifest(f, rows  # type: Iterator[tuple]
+    ):
+# type: (...) -> Iterator[tuple]
+    """Write rows to a manifest file as they pass through."""
+    for row in rows:
+        rel = os.fsencode('/'.join(row[0]))
+        f.write(manifest_record.pack(row[1], row[2], row[3], len(rel)) + rel)
+        yield row
+
+
+def changed_entries(old,  # type: Iterator[tuple]
+     new  # type: Iterator[tuple]
+    ):
+# type: (...) -> Iterator[tuple]
+    """Merge-join two sorted manifests, yielding (path parts, removed) for rows that differ."""
+    sentinel = object()
+    o = next(old, sentinel)
+    n = next(new, sentinel)
+    while o is not sentinel or n is not sentinel:
+        if n is sentinel or o is not sentinel and o[0] < n[0]:
+            yield (o[0], True)
+            o = next(old, sentinel)
+        elif o is sentinel or n[0] < o[0]:
+            yield (n[0], False)
+            n = next(new, sentinel)
+        else:
+            if o[1:] != n[1:]:
+                yield (n[0], False)
+            o = next(old, sentinel)
+            n = next(new, sentinel)
+
+
+def files_from_args(rsync_args,  # type: list
+     files_from_path,  # type: str
+     recursive=False  # type: bool
+    ):
+# type: (...) -> list
+    """Rewrite a job's rsync command to send only the entries listed in files_from_path.
+
+  Entries are NUL separated and relative to the source's parent directory, so
+  they land in the same place as with the full command.
+  """
+    src = abspath(rsync_args[-2])
+    flags = rsync_args[1:-2] + (['-r'] if recursive else []) + ['--from0', '--files-from={_coconut_format_0}'.format(_coconut_format_0=(files_from_path))]
+    return [rsync_args[0]] + flags + [os.path.dirname(src) or '/', rsync_args[-1]]
+
+
+def tree_size(path  # type: str
+    ):
+# type: (...) -> int
+    """Total size of the files under path, without following symlinks."""
+    total = 0
+    stack = [path]
+    while stack:
+        top = stack.pop()
+        try:
+            with os.scandir(top) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+        except NotADirectoryError:
+            total += os.lstat(top).st_size
+        except OSError as e:
+            (error)("Cannot scan {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(top), _coconut_format_1=(e)))
+    return total
+
+
+def balance_shards(sizes,  # type: dict
+     n  # type: int
+    ):
+# type: (...) -> list
+    """Split {name: size} into at most n groups of names with similar total sizes."""
+    import heapq
+# Largest first, each into the currently lightest group
+    groups = [(0, i, []) for i in range(n)]
+    for name in sorted(sizes, key=lambda k: (-sizes[k], k)):
+        total, i, names = heapq.heappop(groups)
+        names.append(name)
+        heapq.heappush(groups, (total + sizes[name], i, names))
+    return [names for _, _, names in (sorted)(groups) if names]
+
+
+@_coconut_tco
+def merge_shard_results(path,  # type: str
+     rsync_args,  # type: list
+     results  # type: list
+    ):
+# type: (...) -> SyncResult
+    """Combine the results of a sharded sync into one."""
+    returncode = next((r.returncode for r in results if r.returncode), 0)
+    failed = ["shard {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(i), _coconut_format_1=(r.output)) for i, r in enumerate(results) if r.returncode]
+    stats = {}
+    for r in results:
+        for name, value in r.stats.items():
+            stats[name] = stats.get(name, 0) + value
+    if stats.get('total_file_size') and stats.get('total_bytes_sent') is not None:
+# Recomputed as rsync does, summing per-shard speedups would be meaningless
+        stats['speedup'] = stats['total_file_size'] / max(stats['total_bytes_sent'] + stats.get('total_bytes_received', 0), 1)
+    output = '\n'.join(failed) if failed else '\n'.join((r.output for r in results))
+    return _coconut_tail_call(SyncResult, path, rsync_args, returncode, output, stats, tuple((e for r in results for e in r.errors)))
+
+
+@_coconut_tco
+def sharded_rsync(path,  # type: str
+     rsync_args  # type: list
+    ):
+# type: (...) -> SyncResult
+    """Sync a directory with shard_count concurrent rsyncs, each sending a size-balanced share of its top-level entries.
+
+  The shards split --bwlimit between them and run in one cgroup, so the job
+  as a whole keeps to its limits.
+  """
+    from concurrent.futures import ThreadPoolExecutor
+    src = abspath(rsync_args[-2])
+    with os.scandir(src) as it:
+        names = [e.name for e in it]
+    if len(names) < 2:
+        return _coconut_tail_call(run_rsync, path, rsync_args)
+    shard_dir = join(state_dir, 'shards')
+    os.makedirs(shard_dir, exist_ok=True)
+    base_name = basename(src)
+    with ThreadPoolExecutor(max_workers=shard_count) as pool:
+        sizes = dict(zip(names, pool.map(tree_size, [join(src, name) for name in names])))
+        shards = balance_shards(sizes, shard_count)
+        shard_sizes = [sum((sizes[name] for name in shard)) for shard in shards]
+        (debug)(*("{_coconut_format_0}: {_coconut_format_1} shards of {_coconut_format_2} bytes".format(_coconut_format_0=(path), _coconut_format_1=(len(shards)), _coconut_format_2=(shard_sizes)), 2))
+        list_paths = []
+        for i, shard in enumerate(shards):
+            list_path = join(shard_dir, "{_coconut_format_0}.{_coconut_format_1}.files".format(_coconut_format_0=(job_id(rsync_args)), _coconut_format_1=(i)))
+            with open(list_path, 'wb') as f:
+                for name in shard:
+                    f.write(os.fsencode(join(base_name, name)) + b'\0')
+            list_paths.append(list_path)
+        cgroup = None
+        try:
+            if cgroup_parent:
+                try:
+                    cgroup = make_cgroup(rsync_args)
+                except OSError as e:
+                    return SyncResult(path, rsync_args, 1, "Cannot set up cgroup under {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(cgroup_parent), _coconut_format_1=(e)))
+            rate = bwlimit and split_rate(bwlimit, len(list_paths))
+            results = (list)(pool.map(lambda list_path: run_rsync(path, files_from_args(rsync_args, list_path, recursive=True), cgroup=cgroup, rate=rate), list_paths))
+        finally:
+            for list_path in list_paths:
+                os.remove(list_path)
+            cgroup and remove_cgroup(cgroup)
+    return _coconut_tail_call(merge_shard_results, path, rsync_args, results)
+
+
+@_coconut_tco
+def transfer(path,  # type: str
+     rsync_args  # type: list
+    ):
+# type: (...) -> SyncResult
+    """Run the rsync for a job, sharded when asked to and the job is a whole directory."""
+    if shard_count > 1 and os.path.isdir(path) and not any((a.startswith('--files-from') for a in rsync_args)):
+        return _coconut_tail_call(sharded_rsync, path, rsync_args)
+    return _coconut_tail_call(run_rsync, path, rsync_args)
+
+
+@traced('manifest')
+def manifest_sync(path,  # type: str
+     rsync_args,  # type: list
+     runner, key=None  # type: str
+    ):
+# type: (...) -> SyncResult
+    """Skip the sync if path is unchanged since the last good run, otherwise send only what changed."""
+    manifest_dir = join(state_dir, 'manifests')
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest_path = join(manifest_dir, ((job_id(rsync_args) if key is None else key)) + '.manifest')
+    new_manifest_path = manifest_path + '.new'
+    files_from_path = manifest_path + '.files'
+# A missing destination means the last manifest no longer describes it
+    have_manifest = exists(manifest_path) and (is_remote(rsync_args[-1]) or exists(rsync_args[-1]))
+    src = normpath(path)
+    base_name = basename(src)
+    changed = removed = 0
+    with open(new_manifest_path, 'wb') as new_manifest:
+        with open(files_from_path, 'wb') as files_from:
+            old = read_manifest(manifest_path) if have_manifest else iter(())
+            new = tee_manifest(new_manifest, scan_tree(src, rules=path_rules(rsync_args)))
+            for rel, gone in changed_entries(old, new):
+                if gone:
+                    removed += 1
+                    continue
+                changed += 1
+                files_from.write(os.fsencode('/'.join((base_name,) + rel)) + b'\0')
+    (debug)(*("{_coconut_format_0}: {_coconut_format_1} changed, {_coconut_format_2} removed since last run".format(_coconut_format_0=(path), _coconut_format_1=(changed), _coconut_format_2=(removed)), 2))
+    try:
+        if not changed:
+            (debug)("No changes in {_coconut_format_0}, skipping rsync".format(_coconut_format_0=(path)))
+            result = SyncResult(path, rsync_args, 0, 'unchanged')
+        elif have_manifest and os.path.isdir(src) and runner is transfer:
+# Snapshots must be complete trees, so they always get a full rsync
+            result = runner(path, files_from_args(rsync_args, files_from_path))
+            result = result._replace(rsync_args=rsync_args)
+        else:
+            result = runner(path, rsync_args)
+        if result.returncode == 0:
+            os.replace(new_manifest_path, manifest_path)
+        return result
+    finally:
+        for leftover in (new_manifest_path, files_from_path):
+            exists(leftover) and os.remove(leftover)
+
+
+@lru_cache()
+@_coconut_tco
+def gear_table():
+# type: (...) -> tuple
+    """256 fixed pseudo-random 64-bit values, one per byte value."""
+    import hashlib
+    return _coconut_tail_call(tuple, (int.from_bytes(hashlib.sha256(bytes([b])).digest()[:8], 'little') for b in range(256)))
+
+
+def chunk_candidates(file_path,  # type: str
+     start,  # type: int
+     end  # type: int
+    ):
+# type: (...) -> list
+    """Return the offsets in [start, end) of a file where the gear hash has its mask bits clear.
+
+  The byte loop holds the GIL, so this runs in worker processes, one segment each.
+  """
+    import mmap
+    gear = gear_table()
+    found = []
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            h = 0
+            for i in range(max(start - chunk_window + 1, 0), min(end, len(data))):
+                h = ((h << 1) + gear[data[i]]) & 0xFFFFFFFFFFFFFFFF
+                if not h & chunk_mask and i >= start:
+                    found.append(i)
+    return found
+
+
+@_coconut_tco
+def chunk_scan_pool():
+    """Process pool for chunk_candidates, forked from a server since callers have threads running."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    return _coconut_tail_call(ProcessPoolExecutor, mp_context=multiprocessing.get_context('forkserver'))
+
+
+def chunk_boundaries(data, candidates=None  # type: list
+    ):
+# type: (...) -> Iterator[tuple]
+    """Yield (start, end) of the content-defined chunks of a buffer.
+
+  Boundaries depend only on the bytes around them, so an insertion early in a
+  file only changes the chunks next to it. candidates are the sorted offsets
+  from chunk_candidates over the whole buffer; without them the buffer is
+  scanned here.
+  """
+    import bisect
+    gear = gear_table()
+    size = len(data)
+    start = 0
+    while start < size:
+        end = min(start + chunk_max_size, size)
+        cut = end
+# The hash restarts at the minimum size, so it only matches the scanned
+# one after a full window
+        reset = start + chunk_min_size
+        stop = end if candidates is None else min(reset + chunk_window - 1, end)
+        h = 0
+        for i in range(reset, stop):
+            h = ((h << 1) + gear[data[i]]) & 0xFFFFFFFFFFFFFFFF
+            if not h & chunk_mask:
+                cut = i + 1
+                break
+        else:
+            if candidates:
+                j = bisect.bisect_left(candidates, reset + chunk_window - 1)
+                if j < len(candidates) and candidates[j] < end:
+                    cut = candidates[j] + 1
+        yield (start, cut)
+        start = cut
+
+
+@_coconut_tco
+def store_chunk(store,  # type: str
+     digest,  # type: str
+     chunk  # type: bytes
+    ):
+# type: (...) -> int
+    """Write a chunk under its hash unless the store already has it; return the bytes written."""
+    chunk_path = join(store, 'chunks', digest[:2], digest)
+    if exists(chunk_path):
+        return 0
+    os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+    tmp_path = "{_coconut_format_0}.{_coconut_format_1}.{_coconut_format_2}.tmp".format(_coconut_format_0=(chunk_path), _coconut_format_1=(os.getpid()), _coconut_format_2=(threading.get_ident()))
+    with open(tmp_path, 'wb') as f:
+        f.write(chunk)
+    os.replace(tmp_path, chunk_path)
+    return _coconut_tail_call(len, chunk)
+
+
+def store_file(store,  # type: str
+     file_path,  # type: str
+     scan_pool=None):
+# type: (...) -> tuple
+    """Chunk a file into the store, returning (chunk hashes, bytes newly written).
+
+  Candidate cuts are scanned in scan_pool when given, segment by segment.
+  """
+    import hashlib
+    import mmap
+    chunks = []
+    written = 0
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return chunks, written
+        if scan_pool is None or size <= chunk_min_size:
+            candidates = None
+        else:
+            starts = range(0, size, chunk_scan_segment)
+            ends = (min(start + chunk_scan_segment, size) for start in starts)
+            candidates = [i for found in scan_pool.map(chunk_candidates, [file_path] * len(starts), starts, ends) for i in found]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for start, end in chunk_boundaries(data, candidates):
+                chunk = data[start:end]
+                digest = hashlib.sha256(chunk).hexdigest()
+                written += store_chunk(store, digest, chunk)
+                chunks.append(digest)
+    return chunks, written
+
+
+@_coconut_tco
+def dedup_runs(store,  # type: str
+     key  # type: str
+    ):
+# type: (...) -> list
+    """Return the run names stored for a job, newest first."""
+    runs_dir = join(store, 'runs', key)
+    if not os.path.isdir(runs_dir):
+        return []
+    names = [name[:-len('.json')] for name in os.listdir(runs_dir) if name.endswith('.json')]
+    return _coconut_tail_call(sorted, [name for name in names if snapshot_name_re.match(name)], reverse=True)
+
+
+def load_dedup_run(store,  # type: str
+     key,  # type: str
+     name  # type: str
+    ):
+# type: (...) -> dict
+    with open(join(store, 'runs', key, name + '.json')) as f:
+        return json.load(f)
+
+
+@contextmanager
+def store_lock(store,  # type: str
+     exclusive=False  # type: bool
+    ):
+    """Hold the store lock: shared while adding a run, exclusive to collect garbage.
+
+  Yields whether the lock was taken; an exclusive lock is only tried, never waited for.
+  """
+    os.makedirs(store, exist_ok=True)
+    with open(join(store, 'lock'), 'a') as lock:
+        if exclusive:
+            got = try_flock(lock)
+        else:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            got = True
+        yield got
+
+
+def collect_garbage(store  # type: str
+    ):
+# type: (...) -> int
+    """Delete chunks no stored run refers to and return how many went."""
+    referenced = set()
+    runs_root = join(store, 'runs')
+    for key in os.listdir(runs_root) if os.path.isdir(runs_root) else []:
+        for name in dedup_runs(store, key):
+            for entry in load_dedup_run(store, key, name)['entries']:
+                referenced.update(entry.get('chunks', ()))
+    removed = 0
+    chunks_root = join(store, 'chunks')
+    for prefix in os.listdir(chunks_root) if os.path.isdir(chunks_root) else []:
+        with os.scandir(join(chunks_root, prefix)) as entries:
+            for e in entries:
+                if e.name not in referenced:
+                    os.remove(e.path)
+                    removed += 1
+    return removed
+
+
+@traced('dedup store')
+@_coconut_tco
+def dedup_sync(path,  # type: str
+     rsync_args,  # type: list
+     key=None  # type: str
+    ):
+# type: (...) -> SyncResult
+    """Store path in the content-addressed store under the output directory.
+
+  Every chunk is kept once under its hash, and each run writes a manifest of
+  the tree pointing at its chunks. Files whose size, mtime and inode match the
+  last run reuse its chunk list without being read. Runs are filed under key,
+  the job's registered id.
+  """
+    from concurrent.futures import ThreadPoolExecutor
+    key = (job_id(rsync_args) if key is None else key)
+    store = join(os.path.dirname(abspath(rsync_args[-1])), dedup_dir_name)
+    src = normpath(path)
+    with store_lock(store):
+        previous = dedup_runs(store, key)
+        reusable = {}
+        if previous:
+            for entry in load_dedup_run(store, key, previous[0])['entries']:
+                if entry['type'] == 'file':
+                    reusable[entry['path']] = entry
+        entries = []
+        pending = []
+        failed = []
+        total_size = 0
+# Threads hash and write chunks, which releases the GIL; processes find the cuts
+        with ExitStack() as stack:
+            with ThreadPoolExecutor(max_workers=max(max_jobs, 4)) as pool:
+                scan_pool = None
+                for parts, size, mtime_ns, inode in scan_tree(src, rules=path_rules(rsync_args)):
+                    full_path = join(src, *parts)
+                    rel = '/'.join(parts)
+                    try:
+                        st = os.lstat(full_path)
+                        entry = {'path': rel, 'mode': st.st_mode & 0o7777, 'mtime_ns': mtime_ns}
+                        if os.path.islink(full_path):
+                            entry.update(type='symlink', target=os.readlink(full_path))
+                        elif os.path.isdir(full_path):
+                            entry.update(type='dir')
+                        elif os.path.isfile(full_path):
+                            entry.update(type='file', size=size, inode=inode)
+                            total_size += size
+                            old = reusable.get(rel)
+                            if old and (old['size'], old['mtime_ns'], old['inode']) == (size, mtime_ns, inode):
+                                entry['chunks'] = old['chunks']
+                            else:
+                                if scan_pool is None and size > chunk_min_size and (os.cpu_count() or 1) > 1:
+                                    scan_pool = stack.enter_context(chunk_scan_pool())
+                                pending.append((entry, pool.submit(store_file, store, full_path, scan_pool)))
+                        else:
+                            continue
+                    except OSError as e:
+                        failed.append("{_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(full_path), _coconut_format_1=(e)))
+                        continue
+                    entries.append(entry)
+                written = 0
+                for entry, future in pending:
+                    try:
+                        entry['chunks'], new_bytes = future.result()
+                        written += new_bytes
+                    except OSError as e:
+                        failed.append("{_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(join(src, entry['path'])), _coconut_format_1=(e)))
+                        entry['chunks'] = None
+        entries = [entry for entry in entries if entry.get('type') != 'file' or entry['chunks'] is not None]
+        name = datetime.utcnow().strftime(snapshot_format)
+        runs_dir = join(store, 'runs', key)
+        os.makedirs(runs_dir, exist_ok=True)
+        tmp_path = join(runs_dir, ".{_coconut_format_0}.tmp".format(_coconut_format_0=(name)))
+        with open(tmp_path, 'w') as f:
+            json.dump({'path': abspath(src), 'rsync_args': rsync_args, 'entries': entries}, f)
+        os.replace(tmp_path, join(runs_dir, name + '.json'))
+    for doomed in expired_snapshots(dedup_runs(store, key), parse_retention(snapshot_keep)):
+        (debug)("Expiring dedup run {_coconut_format_0}/{_coconut_format_1}".format(_coconut_format_0=(key), _coconut_format_1=(doomed)))
+        os.remove(join(runs_dir, doomed + '.json'))
+    with store_lock(store, exclusive=True) as got:
+# Another job adding a run may be relying on chunks that look unreferenced
+        if got:
+            (debug)(*("Removed {_coconut_format_0} unreferenced chunks".format(_coconut_format_0=(collect_garbage(store))), 2))
+    stats = {'number_of_files': len(entries), 'number_of_regular_files_transferred': len(pending) - len(failed), 'total_file_size': total_size, 'total_transferred_file_size': written, 'total_bytes_sent': written, 'speedup': total_size / max(written, 1)}
+    output = '\n'.join(failed[-output_tail_lines:]) if failed else "stored {_coconut_format_0} as run {_coconut_format_1}".format(_coconut_format_0=(src), _coconut_format_1=(name))
+# 23 is what rsync returns when some files could not be transferred
+    return _coconut_tail_call(SyncResult, path, rsync_args, 23 if failed else 0, output, stats)
+
+
+def restore_command(args  # type: list
+    ):
+# type: (...) -> int
+    """Rebuild a run of a job from the dedup store under out_path."""
+    if len(args) not in (2, 3):
+        (error)("Usage: restore <job id prefix> <target dir> [run]")
+        return 1
+    store = join(abspath(out_path), dedup_dir_name)
+    runs_root = join(store, 'runs')
+    keys = [key for key in (os.listdir(runs_root) if os.path.isdir(runs_root) else []) if key.startswith(args[0])]
+    if len(keys) != 1:
+        (error)("{_coconut_format_0} jobs in {_coconut_format_1} match {_coconut_format_2!r}".format(_coconut_format_0=(len(keys)), _coconut_format_1=(store), _coconut_format_2=(args[0])))
+        return 1
+    key = keys[0]
+    runs = dedup_runs(store, key)
+    name = args[2] if len(args) == 3 else runs[0] if runs else None
+    if name not in runs:
+        (error)("No run {_coconut_format_0} of job {_coconut_format_1} in {_coconut_format_2}".format(_coconut_format_0=(name), _coconut_format_1=(key), _coconut_format_2=(store)))
+        return 1
+    run = load_dedup_run(store, key, name)
+    target = join(args[1], basename(run['path']))
+    dirs = []
+    for entry in run['entries']:
+        dest = join(target, entry['path']) if entry['path'] else target
+        _coconut_match_to = entry['type']
+        _coconut_case_check_4 = False
+        if _coconut_match_to == 'dir':
+            _coconut_case_check_4 = True
+        if _coconut_case_check_4:
+            os.makedirs(dest, exist_ok=True)
+            dirs.append((dest, entry))
+            continue
+        if not _coconut_case_check_4:
+            if _coconut_match_to == 'symlink':
+                _coconut_case_check_4 = True
+            if _coconut_case_check_4:
+                os.path.lexists(dest) and os.remove(dest)
+                os.symlink(entry['target'], dest)
+                continue
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        with open(dest, 'wb') as f:
+            for digest in entry['chunks']:
+                with open(join(store, 'chunks', digest[:2], digest), 'rb') as chunk:
+                    shutil.copyfileobj(chunk, f)
+        os.chmod(dest, entry['mode'])
+        os.utime(dest, ns=(entry['mtime_ns'], entry['mtime_ns']))
+# Directories last, deepest first, so restoring their contents does not touch their times
+    for dest, entry in reversed(dirs):
+        os.chmod(dest, entry['mode'])
+        os.utime(dest, ns=(entry['mtime_ns'], entry['mtime_ns']))
+    (log)("Restored run {_coconut_format_0} of {_coconut_format_1} to {_coconut_format_2}".format(_coconut_format_0=(name), _coconut_format_1=(run['path']), _coconut_format_2=(target)))
+    return 0
+
+
+@contextmanager
+def history_db():
+    """Open the run history database, creating it on first use."""
+    import sqlite3
+    os.makedirs(state_dir, exist_ok=True)
+    db = sqlite3.connect(join(state_dir, 'history.sqlite3'), timeout=30)
+    try:
+        with db:
+            db.executescript(history_schema)
+            columns = _coconut.set((row[1] for row in db.execute('PRAGMA table_info(runs)')))
+            for column, statement in history_migrations.items():
+                column in columns or db.execute(statement)
+            yield db
+    finally:
+        db.close()
+
+
+destination_dir = lambda rsync_args: os.path.dirname(rsync_args[-1].rstrip('/'))
+
+
+@traced('history write')
+def record_run(key,  # type: str
+     started,  # type: float
+     finished,  # type: float
+     result  # type: SyncResult
+    ):
+    """Store a run and its rsync --stats in the history database."""
+    import sqlite3
+    stats = result.stats
+    row = (key, result.path, basename(normpath(result.rsync_args[-1])), destination_dir(result.rsync_args), started, finished, result.returncode, stats.get('number_of_files'), stats.get('number_of_regular_files_transferred'), stats.get('total_transferred_file_size'), stats.get('total_bytes_sent'), stats.get('total_bytes_received'), stats.get('speedup'), stats.get('entries_skipped'), stats.get('bytes_skipped'),)
+    try:
+        with history_db() as db:
+            db.execute('INSERT INTO runs (job, path, output, destination, started, finished, exit_code, files_scanned, files_transferred,' ' bytes_transferred, bytes_sent, bytes_received, speedup, entries_skipped, bytes_skipped)' ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+    except sqlite3.Error as e:
+        (error)("Cannot record run of {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(result.path), _coconut_format_1=(e)))
+
+
+prometheus_label = lambda y: y.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+@traced('textfile')
+def write_textfile(path  # type: str
+    ):
+    """Atomically write per-job metrics from the run history in Prometheus text format."""
+    with history_db() as db:
+        jobs = db.execute('SELECT job, MAX(output), MAX(path), COUNT(*), SUM(exit_code != 0),' ' MAX(CASE WHEN exit_code = 0 THEN finished END) FROM runs GROUP BY job ORDER BY job').fetchall()
+        latest = dict(((job), (db.execute('SELECT finished - started, bytes_transferred, files_transferred FROM runs WHERE job = ? ORDER BY started DESC LIMIT 1', (job,)).fetchone())) for job in (row[0] for row in jobs))
+    samples = dict(((name), ([])) for name, _, _ in prometheus_metrics)
+    for job, output, source, runs, failures, last_success in jobs:
+        labels = 'output="{_coconut_format_0}",job="{_coconut_format_1}"'.format(_coconut_format_0=(prometheus_label((basename(normpath(source)) if output is None else output))), _coconut_format_1=(job))
+        duration, bytes_transferred, files_transferred = latest[job]
+        values = {'backup_cron_last_success_timestamp_seconds': last_success, 'backup_cron_last_duration_seconds': duration, 'backup_cron_last_bytes_transferred': bytes_transferred, 'backup_cron_last_files_transferred': files_transferred, 'backup_cron_runs_total': runs, 'backup_cron_failures_total': failures}
+        for name, value in values.items():
+            value is None or samples[name].append("{_coconut_format_0}{{{_coconut_format_1}}} {_coconut_format_2}".format(_coconut_format_0=(name), _coconut_format_1=(labels), _coconut_format_2=(value)))
+    lines = []
+    for name, kind, help_text in prometheus_metrics:
+        lines += ["# HELP {_coconut_format_0} {_coconut_format_1}".format(_coconut_format_0=(name), _coconut_format_1=(help_text)), "# TYPE {_coconut_format_0} {_coconut_format_1}".format(_coconut_format_0=(name), _coconut_format_1=(kind))] + samples[name]
+# node_exporter may read the file at any moment, so it is swapped in whole
+    tmp_path = "{_coconut_format_0}.{_coconut_format_1}.tmp".format(_coconut_format_0=(path), _coconut_format_1=(os.getpid()))
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def lock_holder(lock_path  # type: str
+    ):
+# type: (...) -> tuple
+    """Return (pid, start time) written by the run holding a job lock, or (None, None)."""
+    try:
+        with open(lock_path) as f:
+            pid, started = f.read().split()
+        return int(pid), float(started)
+    except (OSError, ValueError):
+        return None, None
+
+
+def kill_run(pid  # type: int
+    ):
+    """Terminate a run and the rsync it spawned."""
+# Cron starts each job in its own process group; never signal our own
+    pgid = os.getpgid(pid)
+    kill = (lambda sig: os.kill(pid, sig)) if pgid == os.getpgrp() else (lambda sig: os.killpg(pgid, sig))
+    kill(signal.SIGTERM)
+    deadline = time.monotonic() + kill_grace_seconds
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.1)
+    kill(signal.SIGKILL)
+
+
+def try_flock(f):
+# type: (...) -> bool
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def acquire_job_lock(path,  # type: str
+     key  # type: str
+    ):
+    """Take the run lock for a job according to overlap_policy.
+
+  Returns the open lock file, or None if this run should be skipped.
+  """
+    lock_dir = join(state_dir, 'locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_path = join(lock_dir, key + '.lock')
+    lock = open(lock_path, 'a+')
+    if not try_flock(lock):
+        pid, started = lock_holder(lock_path)
+        _coconut_match_to = overlap_policy
+        _coconut_case_check_5 = False
+        if _coconut_match_to == 'queue':
+            _coconut_case_check_5 = True
+        if _coconut_case_check_5:
+            queue = open(lock_path + '.queue', 'a+')
+            if not try_flock(queue):
+                queue.close()
+                lock.close()
+                (log)("Skipping {_coconut_format_0}: a run is already running (pid {_coconut_format_1}) and another is queued".format(_coconut_format_0=(path), _coconut_format_1=(pid)))
+                return None
+            (debug)("Queued {_coconut_format_0} behind running pid {_coconut_format_1}".format(_coconut_format_0=(path), _coconut_format_1=(pid)))
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            queue.close()
+        if not _coconut_case_check_5:
+            if _coconut_match_to == 'kill':
+                _coconut_case_check_5 = True
+            if _coconut_case_check_5 and not (pid and started and time.time() - started > overlap_stale_after):
+                _coconut_case_check_5 = False
+            if _coconut_case_check_5:
+                (log)("Killing stale run of {_coconut_format_0} (pid {_coconut_format_1}, started {_coconut_format_2})".format(_coconut_format_0=(path), _coconut_format_1=(pid), _coconut_format_2=(datetime.utcfromtimestamp(started))))
+                try:
+                    kill_run(pid)
+                except ProcessLookupError:
+                    pass
+                fcntl.flock(lock, fcntl.LOCK_EX)
+        if not _coconut_case_check_5:
+            lock.close()
+            (log)("Skipping {_coconut_format_0}: previous run (pid {_coconut_format_1}) is still running".format(_coconut_format_0=(path), _coconut_format_1=(pid)))
+            return None
+    lock.seek(0)
+    lock.truncate()
+    lock.write("{_coconut_format_0} {_coconut_format_1}\n".format(_coconut_format_0=(os.getpid()), _coconut_format_1=(time.time())))
+    lock.flush()
+    return lock
+
+
+@_coconut_tco
+def retryable(result  # type: SyncResult
+    ):
+# type: (...) -> bool
+    """Whether another attempt may get past the way rsync failed."""
+    if result.returncode == 23:
+        return _coconut_tail_call(any, (transient_error_re.search(line) for line in result.errors))
+    return result.returncode in retryable_exit_codes
+
+
+def with_retries(path,  # type: str
+     attempt):
+# type: (...) -> SyncResult
+    """Call attempt() until it succeeds, fails in a way retrying cannot fix, or retry_count retries are used.
+
+  The wait doubles after each try, with jitter so jobs that failed together
+  do not all retry together. Every retry resumes from the files rsync left
+  in its partial directory.
+  """
+    import random
+    result = attempt()
+    for n in range(retry_count):
+        if not retryable(result):
+            break
+        delay = min(retry_delay * 2**n, retry_max_delay) * random.uniform(0.5, 1)
+        (log)("{_coconut_format_0}: rsync exited {_coconut_format_1}, retry {_coconut_format_2} of {_coconut_format_3} in {_coconut_format_4:.1f}s".format(_coconut_format_0=(path), _coconut_format_1=(result.returncode), _coconut_format_2=(n + 1), _coconut_format_3=(retry_count), _coconut_format_4=(delay)))
+        time.sleep(delay)
+        result = attempt()
+    return result
+
+
+@traced('sync')
+@_coconut_tco
+def sync(path,  # type: str
+     rsync_args,  # type: list
+     key=None  # type: str
+    ):
+# type: (...) -> SyncResult
+    """Run rsync for path under its job lock, holding a slot on its source and destination devices.
+
+  key is the job's registered id. Cron runs pass it, because their spec holds
+  absolute paths, which hash to a different id than the command line's.
+  """
+    key = (job_id(rsync_args) if key is None else key)
+    with span('job lock', target=path):
+        lock = acquire_job_lock(path, key)
+    if lock is None:
+        return _coconut_tail_call(SyncResult, path, rsync_args, 0, 'skipped')
+# Sorted acquisition so two workers can never wait on each other's device
+    devices = (sorted)(_coconut.set((device_key(path),)) | (set() if is_remote(out_path) else _coconut.set((device_key(out_path),))))
+    runner = (lambda p, a: dedup_sync(p, a, key)) if store_backend == 'dedup' else snapshot_sync if snapshot_mode else transfer
+    def attempt():
+# type: (...) -> SyncResult
+        with ExitStack() as stack:
+            with span('device slots', target=path):
+                for dev in devices:
+                    (stack.enter_context)((device_lock)(dev))
+            return manifest_sync(path, rsync_args, runner, key) if manifest_mode else runner(path, rsync_args)
+    with lock:
+        started = time.time()
+        result = with_retries(path, attempt)
+        record_run(key, started, time.time(), result)
+        return result
+
+
+@traced('sync batch')
+def sync_batch(jobs,  # type: list
+     keys={}  # type: dict
+    ):
+# type: (...) -> list
+    """Sync (path, rsync_args) file jobs sharing flags and a destination directory with one rsync.
+
+  Each job still takes its own lock and gets its own result and history row:
+  a job fails if rsync names its path in an error message, or if rsync failed
+  without naming any. The batch's --stats cannot be split, so the rows go
+  without them. keys maps paths to their registered job ids.
+  """
+    results = []
+    runnable = []
+    with ExitStack() as stack:
+        for path, rsync_args in jobs:
+            lock = acquire_job_lock(path, (lambda _coconut_none_coalesce_item: job_id(rsync_args) if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(keys.get(path)))
+            if lock is None:
+                results.append(SyncResult(path, rsync_args, 0, 'skipped'))
+                continue
+            stack.enter_context(lock)
+            runnable.append((path, rsync_args))
+        if not runnable:
+            return results
+        devices = (sorted)(_coconut.set((device_key(path) for path, _ in runnable)) | (set() if is_remote(out_path) else _coconut.set((device_key(out_path),))))
+        batch_dir = join(state_dir, 'batches')
+        os.makedirs(batch_dir, exist_ok=True)
+        list_path = join(batch_dir, "{_coconut_format_0}-{_coconut_format_1}.files".format(_coconut_format_0=(os.getpid()), _coconut_format_1=(threading.get_ident())))
+        with open(list_path, 'wb') as f:
+            for path, _ in runnable:
+                f.write(os.fsencode(abspath(path).lstrip('/')) + b'\0')
+        flags = runnable[0][1][:-2]
+# --no-relative drops the source directories, so each file lands where its own rsync would put it
+        dest_dir = os.path.dirname(runnable[0][1][-1])
+# Every error naming a batched path is needed, any other only as output
+        quoted = _coconut.set((abspath(path) for path, _ in runnable)) | _coconut.set((abspath(path).lstrip('/') for path, _ in runnable))
+        names_batched = lambda line: any((name in quoted for name in rsync_quoted_re.findall(line)))
+        def attempt():
+# type: (...) -> SyncResult
+            with ExitStack() as device_stack:
+                for dev in devices:
+                    (device_stack.enter_context)((device_lock)(dev))
+                return run_rsync("{_coconut_format_0} files".format(_coconut_format_0=(len(runnable))), flags + ['--no-relative', '--from0', '--files-from={_coconut_format_0}'.format(_coconut_format_0=(list_path)), '/', dest_dir + '/'], wanted_error=names_batched)
+        started = time.time()
+        try:
+            batch = with_retries("{_coconut_format_0} files".format(_coconut_format_0=(len(runnable))), attempt)
+        finally:
+            os.remove(list_path)
+        finished = time.time()
+        mentions = lambda path, line: '"{_coconut_format_0}"'.format(_coconut_format_0=(abspath(path))) in line or '"{_coconut_format_0}"'.format(_coconut_format_0=(abspath(path).lstrip("/"))) in line
+        named = _coconut.set((path for path, _ in runnable if any((mentions(path, line) for line in batch.errors))))
+        for path, rsync_args in runnable:
+            if path in named:
+                result = SyncResult(path, rsync_args, batch.returncode or 23, ('\n'.join)([e for e in batch.errors if mentions(path, e)]))
+            elif batch.returncode and not named:
+                result = SyncResult(path, rsync_args, batch.returncode, batch.output)
+            else:
+                result = SyncResult(path, rsync_args, 0, batch.output)
+            record_run((lambda _coconut_none_coalesce_item: job_id(rsync_args) if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(keys.get(path)), started, finished, result)
+            results.append(result)
+    return results
+
+
+def batch_jobs(jobs  # type: list
+    ):
+# type: (...) -> tuple
+    """Split jobs into (jobs synced on their own, batches of file jobs sharing flags and a destination directory)."""
+    if snapshot_mode or manifest_mode or store_backend == 'dedup':
+        (debug)(*("Batching only applies to plain rsync mirrors", 2))
+        return jobs, []
+    groups = {}
+    singles = []
+    for path, rsync_args in jobs:
+        if os.path.isdir(path):
+# rsync puts a directory inside its own destination, which no other path shares
+            singles.append((path, rsync_args))
+        else:
+            groups.setdefault((tuple(rsync_args[:-2]), os.path.dirname(rsync_args[-1])), []).append((path, rsync_args))
+    batches = [group for group in groups.values() if len(group) > 1]
+    singles += [group[0] for group in groups.values() if len(group) == 1]
+    return singles, batches
+
+
+absolute = lambda y: y if is_remote(y) else abspath(y)
+
+@_coconut_tco
+def option_error():
+# type: (...) -> str
+    """Describe what is wrong with the option globals, or None if they are usable."""
+    if transfer_profile != 'auto' and transfer_profile not in transfer_profiles:
+        return _coconut_tail_call("Unknown transfer profile {_coconut_format_0!r}".format, _coconut_format_0=(transfer_profile))
+    if overlap_policy not in overlap_policies:
+        return _coconut_tail_call("Unknown overlap policy {_coconut_format_0!r}".format, _coconut_format_0=(overlap_policy))
+    if per_device_limit is not None and per_device_limit < 1:
+        return "--per-device must be at least 1"
+    if cron_slices_str:
+        from crontab import CronSlices
+        if not CronSlices.is_valid((lambda _coconut_none_coalesce_item: cron_slices_str if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(cron_specials.get(cron_slices_str))):
+            return _coconut_tail_call("Invalid cron schedule {_coconut_format_0!r}".format, _coconut_format_0=(cron_slices_str))
+    if snapshot_mode:
+        try:
+            parse_retention(snapshot_keep)
+        except ValueError as e:
+            return _coconut_tail_call(str, e)
+    if ionice_class:
+        name, _, level = ionice_class.partition(':')
+        if name not in ionice_classes or level and not (level.isdigit() and int(level) < 8):
+            return _coconut_tail_call("Unknown I/O scheduling class {_coconut_format_0!r}".format, _coconut_format_0=(ionice_class))
+    if (io_max or memory_max) and not cgroup_parent:
+        return "--io-max and --memory-max need --cgroup"
+    if snapshot_mode and is_remote(out_path):
+        return "Snapshots need a local --output"
+    if store_backend not in store_backends:
+        return _coconut_tail_call("Unknown store backend {_coconut_format_0!r}".format, _coconut_format_0=(store_backend))
+    if scheduler_mode not in schedulers:
+        return _coconut_tail_call("Unknown scheduler {_coconut_format_0!r}".format, _coconut_format_0=(scheduler_mode))
+    if store_backend == 'dedup':
+        if is_remote(out_path):
+            return "The dedup store needs a local --output"
+        try:
+            parse_retention(snapshot_keep)
+        except ValueError as e:
+            return _coconut_tail_call(str, e)
+    return None
+
+
+def job_spec(path,  # type: str
+     rsync_args  # type: list
+    ):
+# type: (...) -> dict
+    """Everything `run <job id>` needs to repeat this sync, with paths made absolute for cron."""
+    options = dict(((name), (globals()[name])) for name in job_spec_options)
+    options['out_path'] = absolute(out_path)
+    options['textfile_path'] = textfile_path and abspath(textfile_path)
+    options['cgroup_parent'] = cgroup_parent and abspath(cgroup_parent)
+    return {'path': abspath(path), 'rsync_args': rsync_args[:-2] + [absolute(rsync_args[-2]), absolute(rsync_args[-1])], 'options': options}
+
+
+def save_job_spec(key,  # type: str
+     spec  # type: dict
+    ):
+    """Store a job spec where `run` finds it."""
+    jobs_dir = join(state_dir, 'jobs')
+    os.makedirs(jobs_dir, exist_ok=True)
+    tmp_path = join(jobs_dir, ".{_coconut_format_0}.tmp".format(_coconut_format_0=(key)))
+    with open(tmp_path, 'w') as f:
+        json.dump(spec, f, indent=2)
+    os.replace(tmp_path, join(jobs_dir, key + '.json'))
+
+
+def load_job_spec(key  # type: str
+    ):
+# type: (...) -> dict
+    """Load a stored job spec, or None if the job was never registered."""
+    try:
+        with open(join(state_dir, 'jobs', key + '.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def remove_job_spec(key  # type: str
+    ):
+    """Forget a stored job spec."""
+    spec_path = join(state_dir, 'jobs', key + '.json')
+    exists(spec_path) and os.remove(spec_path)
+
+
+def spec_jobs(key,  # type: str
+     spec  # type: dict
+    ):
+# type: (...) -> list
+    """The (job id, path, rsync_args) a registered job syncs: itself, or each path of a batch."""
+    if spec.get('batch'):
+        return [tuple(member) for member in spec['batch']]
+    return [(key, spec['path'], spec['rsync_args'])]
+
+
+@_coconut_tco
+def job_command(key  # type: str
+    ):
+# type: (...) -> str
+    """The command cron runs for a job."""
+# Cron goes through backup_run.py rather than rsync so every run takes the job lock
+# (and snapshots/manifests get their per-run work) at the lowest start-up cost
+    runner = join(os.path.dirname(abspath(__file__)), 'backup_run.py')
+    return _coconut_tail_call((" ".join), map(shlex.quote, [sys.executable, runner, '--state-dir', abspath(state_dir), 'run', key]))
+
+
+@_coconut_tco
+def file_digest(file_path  # type: str
+    ):
+# type: (...) -> str
+    """SHA-256 of a file's contents."""
+    import hashlib
+    import mmap
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size >= verify_mmap_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                h.update(data)
+        else:
+            h.update(f.read())
+    return _coconut_tail_call(h.hexdigest)
+
+
+@traced('verify')
+def verify_job(path,  # type: str
+     rsync_args,  # type: list
+     key  # type: str
+    ):
+# type: (...) -> int
+    """Compare a job's source files with its copies by content and return how many differ.
+
+  Digests are cached by (device, inode, size, mtime), so only files that
+  changed since they were last verified are read again. Files modified after
+  the job's last successful sync are skipped rather than reported.
+  """
+    from concurrent.futures import Future
+    from concurrent.futures import ThreadPoolExecutor
+    if is_remote(rsync_args[-1]):
+        (log)("Skipping {_coconut_format_0}: remote copies are not verified".format(_coconut_format_0=(path)))
+        return 0
+    src = normpath(path)
+    dest = join(rsync_args[-1], 'latest') if snapshot_mode else rsync_args[-1]
+    dest_root = join(dest, basename(src)) if os.path.isdir(src) else dest
+    counts = {'verified': 0, 'hashed': 0, 'changed': 0, 'missing': 0, 'mismatched': 0}
+    with history_db() as db:
+        with ThreadPoolExecutor() as pool:
+            synced_at = db.execute('SELECT MAX(started) FROM runs WHERE job = ? AND exit_code = 0', (key,)).fetchone()[0]
+            new_digests = []
+
+            def save_digests():
+                db.executemany('INSERT OR REPLACE INTO checksums (dev, inode, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?)', new_digests)
+                db.commit()
+                new_digests.clear()
+
+            @_coconut_tco
+            def digest_of(file_path, st):
+                row = db.execute('SELECT digest FROM checksums WHERE dev = ? AND inode = ? AND size = ? AND mtime_ns = ?', (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)).fetchone()
+                if row:
+                    return row[0]
+                counts['hashed'] += 1
+                return _coconut_tail_call(pool.submit, file_digest, file_path)
+
+            def settle(pair):
+                rel, sides = pair
+                digests = []
+                for file_path, st, digest in sides:
+                    if isinstance(digest, Future):
+                        try:
+                            digest = digest.result()
+                        except OSError as e:
+                            (error)("Cannot verify {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(file_path), _coconut_format_1=(e)))
+                            counts['mismatched'] += 1
+                            return
+                        new_digests.append((st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, digest))
+                        if len(new_digests) >= verify_commit_rows:
+                            save_digests()
+                    digests.append(digest)
+                if digests[0] == digests[1]:
+                    counts['verified'] += 1
+                else:
+                    (error)("{_coconut_format_0}: {_coconut_format_1} differs from {_coconut_format_2}".format(_coconut_format_0=(path), _coconut_format_1=(rel), _coconut_format_2=(sides[1][0])))
+                    counts['mismatched'] += 1
+
+            window = deque()
+            for parts, _, _, _ in scan_tree(src, rules=path_rules(rsync_args)):
+                src_path = join(src, *parts)
+                rel = '/'.join(parts) or basename(src)
+                try:
+                    src_st = os.lstat(src_path)
+                except OSError:
+                    continue
+                if not os.path.isfile(src_path) or os.path.islink(src_path):
+                    continue
+                if synced_at and src_st.st_mtime_ns > synced_at * 1e9:
+                    counts['changed'] += 1
+                    continue
+                dest_path = join(dest_root, *parts)
+                try:
+                    dest_st = os.stat(dest_path)
+                except OSError:
+                    (error)("{_coconut_format_0}: {_coconut_format_1} is missing from {_coconut_format_2}".format(_coconut_format_0=(path), _coconut_format_1=(rel), _coconut_format_2=(dest_root)))
+                    counts['missing'] += 1
+                    continue
+                if dest_st.st_size != src_st.st_size:
+                    (error)("{_coconut_format_0}: {_coconut_format_1} is {_coconut_format_2} bytes but {_coconut_format_3} in {_coconut_format_4}".format(_coconut_format_0=(path), _coconut_format_1=(rel), _coconut_format_2=(src_st.st_size), _coconut_format_3=(dest_st.st_size), _coconut_format_4=(dest_root)))
+                    counts['mismatched'] += 1
+                    continue
+                window.append((rel, [(src_path, src_st, digest_of(src_path, src_st)), (dest_path, dest_st, digest_of(dest_path, dest_st)),]))
+                if len(window) >= verify_window:
+                    settle(window.popleft())
+            while window:
+                settle(window.popleft())
+            new_digests and save_digests()
+    summary = (", ".join)(["{_coconut_format_0} {_coconut_format_1}".format(_coconut_format_0=(n), _coconut_format_1=(name)) for name, n in counts.items()])
+    (log)("Verified {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(path), _coconut_format_1=(summary)))
+    return counts['missing'] + counts['mismatched']
+
+
+def report_result(result  # type: SyncResult
+    ):
+# type: (...) -> bool
+    """Log how a sync went and return whether it succeeded."""
+    if result.returncode == 0:
+        (debug)("Synced {_coconut_format_0}".format(_coconut_format_0=(result.path)))
+        if result.stats.get('entries_skipped'):
+            measured = result.stats.get('bytes_skipped')
+            (debug)("{_coconut_format_0}: filters left out {_coconut_format_1} entries".format(_coconut_format_0=(result.path), _coconut_format_1=(result.stats['entries_skipped'])) + ('' if measured is None else ", {_coconut_format_0} bytes".format(_coconut_format_0=(measured))))
+        return True
+    (error)("rsync failed for {_coconut_format_0} (exit {_coconut_format_1}): {_coconut_format_2}".format(_coconut_format_0=(result.path), _coconut_format_1=(result.returncode), _coconut_format_2=(result.output)))
+    return False
+
+
+def run_syncs(jobs,  # type: list
+     sync_job=sync, batches=[]  # type: list
+    ):
+# type: (...) -> tuple
+    """Sync (path, rsync_args) jobs, and batches of them, through the worker pool and return (synced results, failure count)."""
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import as_completed
+    synced = []
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(max_jobs, 1)) as pool:
+        futures = dict(((pool.submit(sync_job, path, rsync_args)), ([(path, rsync_args)])) for path, rsync_args in jobs)
+        for batch in batches:
+            futures[pool.submit(sync_batch, batch)] = batch
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+# One path going wrong must not take the rest of the run with it
+                results = [SyncResult(path, rsync_args, 1, "{_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(type(e).__name__), _coconut_format_1=(e))) for path, rsync_args in futures[future]]
+            for result in results if isinstance(results, list) else [results]:
+                if report_result(result):
+                    synced.append(result)
+                else:
+                    failures += 1
+    return synced, failures
+
+
+class Inotify(_coconut.object):
+    """Minimal recursive inotify watcher over libc."""
+
+    def __init__(self):
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+# watch descriptor -> [(job path, watched directory, only this name or None)]
+        self.watches = {}
+
+    def add_watch(self, job_path,  # type: str
+     dirpath,  # type: str
+     only=None  # type: str
+    ):
+        import ctypes
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), watch_mask | IN_ONLYDIR)
+        if wd < 0:
+            (error)("Cannot watch {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(dirpath), _coconut_format_1=(os.strerror(ctypes.get_errno()))))
+            return
+# The kernel hands out one descriptor per directory, shared by every job watching it
+        self.watches.setdefault(wd, []).append((job_path, dirpath, only))
+
+    def add_tree(self, job_path,  # type: str
+     top  # type: str
+    ):
+        """Watch top and every directory below it; a file is watched through its parent."""
+        if not os.path.isdir(top):
+            self.add_watch(job_path, os.path.dirname(top) or '.', basename(top))
+            return
+        for dirpath, _, _ in os.walk(top):
+            self.add_watch(job_path, dirpath)
+
+    def read_events(self):
+# type: (...) -> Iterator[tuple]
+        """Yield (job path, changed path, mask) for the events waiting on the fd."""
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = inotify_event.unpack_from(buf, offset)
+            name = (os.fsdecode)(buf[offset + inotify_event.size:offset + inotify_event.size + length].rstrip(b'\0'))
+            offset += inotify_event.size + length
+            if mask & IN_Q_OVERFLOW:
+                yield (None, None, mask)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            for job_path, dirpath, only in self.watches.get(wd, []):
+                if only is None or name == only:
+                    yield (job_path, join(dirpath, name) if name else dirpath, mask)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def sync_changed(path,  # type: str
+     rsync_args,  # type: list
+     changed  # type: set
+    ):
+# type: (...) -> SyncResult
+    """Sync only the changed entries of a directory job; new directories are sent recursively."""
+    list_dir = join(state_dir, 'watch')
+    os.makedirs(list_dir, exist_ok=True)
+    list_path = join(list_dir, job_id(rsync_args) + '.files')
+    parent = os.path.dirname(abspath(rsync_args[-2]))
+    with open(list_path, 'wb') as f:
+        for entry in (sorted)(changed):
+            f.write(os.fsencode(os.path.relpath(entry, parent)) + b'\0')
+    try:
+        changed_args = files_from_args(rsync_args, list_path, recursive=True)
+        return sync(path, changed_args, job_id(rsync_args))._replace(rsync_args=rsync_args)
+    finally:
+        os.remove(list_path)
+
+
+def collapse_entries(entries  # type: set
+    ):
+# type: (...) -> set
+    """Drop entries that are already covered by a changed ancestor directory."""
+    kept = set()
+    for entry in (sorted)(entries):
+        if not any((entry.startswith(d + '/') for d in kept if os.path.isdir(d))):
+            kept.add(entry)
+    return kept
+
+
+def watch(jobs  # type: list
+    ):
+# type: (...) -> int
+    """Keep syncing jobs as inotify reports changes until interrupted."""
+    watcher = Inotify()
+    paths = dict(((path), (rsync_args)) for path, rsync_args in jobs)
+    for path in paths:
+        watcher.add_tree(path, abspath(path))
+# job path -> changed entries, or None when the job needs a full sync
+    pending = {}
+    first_event = last_event = 0.0
+    failures = 0
+    (log)("Watching {_coconut_format_0} paths".format(_coconut_format_0=(len(paths))))
+    try:
+        while True:
+            timeout = watch_debounce if pending else None
+            if select.select([watcher.fd], [], [], timeout)[0]:
+                now = time.monotonic()
+                first_event = first_event or now
+                last_event = now
+                for job_path, changed, mask in watcher.read_events():
+                    if mask & IN_Q_OVERFLOW:
+                        (error)("inotify queue overflowed, falling back to full syncs")
+                        pending = dict(((path), (None)) for path in paths)
+                        continue
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        watcher.add_tree(job_path, changed)
+                    if pending.get(job_path, set()) is None:
+                        continue
+                    entries = pending.setdefault(job_path, set())
+# Deletions are not propagated, so only the parent needs to know
+                    if mask & (IN_DELETE | IN_DELETE_SELF | IN_MOVED_FROM | IN_MOVE_SELF):
+                        continue
+                    entries.add(changed)
+                    if len(entries) > watch_queue_limit:
+                        (debug)(*("Too many changes under {_coconut_format_0}, doing a full sync".format(_coconut_format_0=(job_path)), 2))
+                        pending[job_path] = None
+            now = time.monotonic()
+            quiet = now - last_event >= watch_debounce
+            overdue = now - first_event >= watch_debounce * watch_max_delay_factor
+            if not pending or not (quiet or overdue):
+                continue
+            batch, pending, first_event = pending, {}, 0.0
+            full_jobs = []
+            partial_jobs = []
+            for job_path, entries in batch.items():
+                if entries is None or snapshot_mode or manifest_mode or store_backend == 'dedup' or not os.path.isdir(job_path):
+                    full_jobs.append((job_path, paths[job_path]))
+                else:
+                    entries = (collapse_entries)(_coconut.set((e for e in entries if os.path.lexists(e))))
+                    if entries:
+                        partial_jobs.append((job_path, paths[job_path], entries))
+            _, full_failures = run_syncs(full_jobs)
+            changed_of = dict(((job_path), (entries)) for job_path, _, entries in partial_jobs)
+            _, partial_failures = run_syncs([(p, a) for p, a, _ in partial_jobs], sync_job=lambda p, a: sync_changed(p, a, changed_of[p]))
+            failures += full_failures + partial_failures
+            textfile_path and write_textfile(textfile_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 1 if failures else 0
+
+
+mean = lambda xs: sum(xs) / len(xs) if xs else None
+format_time = lambda t: datetime.utcfromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')
+
+@_coconut_tco
+def trend(recent,  # type: list
+     previous  # type: list
+    ):
+# type: (...) -> str
+    """Percent change of the recent mean over the previous one."""
+    if not recent or not previous or not mean(previous):
+        return '-'
+    return _coconut_tail_call("{_coconut_format_0:+.0f}%".format, _coconut_format_0=((mean(recent) / mean(previous) - 1) * 100))
+
+
+def history_command(args  # type: list
+    ):
+# type: (...) -> int
+    """Print run trends per job, or the recent runs of the jobs matching a job id prefix."""
+    with history_db() as db:
+        if not args:
+            (print)("job\tpath\truns\tfailed\tlast run\tmean secs\tsecs trend\tmean bytes sent\tbytes trend")
+            jobs = db.execute('SELECT job, path, COUNT(*), SUM(exit_code != 0), MAX(started) FROM runs GROUP BY job ORDER BY path').fetchall()
+            for job, path, count, failed, last in jobs:
+                rows = db.execute('SELECT finished - started, bytes_sent FROM runs WHERE job = ? AND exit_code = 0 ORDER BY started DESC LIMIT ?', (job, 2 * history_trend_window)).fetchall()
+                durations = [d for d, _ in rows]
+                sent = [b for _, b in rows if b is not None]
+                recent_durations, previous_durations = durations[:history_trend_window], durations[history_trend_window:]
+                recent_sent, previous_sent = sent[:history_trend_window], sent[history_trend_window:]
+                mean_duration = mean(recent_durations)
+                mean_sent = mean(recent_sent)
+                (print)(("\t".join)(map(str, (job[:12], path, count, failed, format_time(last), '-' if mean_duration is None else "{_coconut_format_0:.1f}".format(_coconut_format_0=(mean_duration)), trend(recent_durations, previous_durations), '-' if mean_sent is None else "{_coconut_format_0:.0f}".format(_coconut_format_0=(mean_sent)), trend(recent_sent, previous_sent),))))
+            return 0
+        rows = db.execute('SELECT job, started, finished - started, exit_code, files_scanned, files_transferred, bytes_sent, bytes_received, speedup,' ' entries_skipped, bytes_skipped' ' FROM runs WHERE job LIKE ? ORDER BY started DESC LIMIT ?', (args[0] + '%', history_list_limit)).fetchall()
+    if not rows:
+        (error)("No runs recorded for job {_coconut_format_0}".format(_coconut_format_0=(args[0])))
+        return 1
+    (print)("job\tstarted\tsecs\texit\tfiles\ttransferred\tbytes sent\tbytes received\tspeedup\tentries skipped\tbytes skipped")
+    for row in rows:
+        job, started, duration = row[:3]
+        (print)(("\t".join)(map(str, (job[:12], format_time(started), "{_coconut_format_0:.1f}".format(_coconut_format_0=(duration))) + tuple(('-' if x is None else x for x in row[3:])))))
+    return 0
+
+
+def run_command(args  # type: list
+    ):
+# type: (...) -> int
+    """Sync one registered job with the options it was registered with."""
+    if len(args) != 1:
+        (error)("Usage: run <job id>")
+        return 1
+    key = args[0]
+    spec = load_job_spec(key)
+    if spec is None:
+        (error)("No job {_coconut_format_0} registered in {_coconut_format_1}".format(_coconut_format_0=(key), _coconut_format_1=(state_dir)))
+        return 1
+    globals().update(spec['options'])
+    lower_priority()
+    keys = dict(((path), (member_key)) for member_key, path, _ in spec_jobs(key, spec))
+    with remote_session():
+        if spec.get('batch'):
+            results = sync_batch([(path, rsync_args) for _, path, rsync_args in spec_jobs(key, spec)], keys)
+        else:
+            results = [sync(spec['path'], spec['rsync_args'], key)]
+    ok = True
+    for result in results:
+        if not report_result(result):
+            ok = False
+        elif verify_mode and store_backend != 'dedup' and result.output != 'skipped':
+            ok = not verify_job(result.path, result.rsync_args, keys[result.path]) and ok
+    textfile_path and write_textfile(textfile_path)
+    return 0 if ok else 1
+
+
+@contextmanager
+def job_options(options  # type: dict
+    ):
+    """Set option globals for the duration of the block."""
+    saved = dict(((name), (globals()[name])) for name in options)
+    globals().update(options)
+    try:
+        yield
+    finally:
+        globals().update(saved)
+
+
+def load_config(path  # type: str
+    ):
+# type: (...) -> dict
+    """Read a jobs config file into {job id: (source, schedule, job spec, stagger)}.
+
+  Top level keys are defaults for every job; anything a job leaves unset
+  comes from the environment and command line. Relative paths are taken
+  from the config file's directory.
+  """
+    with open(path) as f:
+        config = json.load(f)
+    base = os.path.dirname(abspath(path))
+    resolve = lambda y: y if is_remote(y) else abspath(join(base, os.path.expanduser(y)))
+    defaults = dict(((name), (value)) for name, value in config.items() if name != 'jobs')
+    desired = {}
+    for entry in config.get('jobs', []):
+        settings = dict(defaults)
+        settings.update(entry)
+        unknown = set(settings) - set(config_options) - _coconut.set(('sources', 'schedule'))
+        if unknown:
+            raise ValueError("Unknown config keys {_coconut_format_0}".format(_coconut_format_0=(', '.join(sorted(unknown)))))
+        sources = (lambda _coconut_none_coalesce_item: [] if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(settings.get('sources'))
+        sources = [sources] if isinstance(sources, str) else sources
+        if not settings.get('schedule'):
+            raise ValueError("No schedule for {_coconut_format_0}".format(_coconut_format_0=(', '.join(sources))))
+        options = dict(((config_options[name]), (value)) for name, value in settings.items() if name in config_options)
+        for name in ('out_path', 'textfile_path', 'cgroup_parent'):
+            if options.get(name):
+                options[name] = resolve(options[name])
+        for name in ('include_patterns', 'exclude_patterns'):
+            if isinstance(options.get(name), str):
+                options[name] = [options[name]]
+        with job_options(options):
+            problem = option_error()
+            if problem:
+                raise ValueError(problem)
+            for source in map(resolve, sources):
+                if not exists(source):
+                    raise ValueError("{_coconut_format_0} does not exist".format(_coconut_format_0=(source)))
+                rsync_args = build_rsync_args(source)
+                desired[job_id(rsync_args)] = (source, settings['schedule'], job_spec(source, rsync_args), stagger_mode)
+    return desired
+
+
+@_coconut_tco
+def registered_jobs(prefix=''  # type: str
+    ):
+# type: (...) -> list
+    """The ids of registered jobs starting with prefix, sorted."""
+    jobs_dir = join(state_dir, 'jobs')
+    names = os.listdir(jobs_dir) if os.path.isdir(jobs_dir) else []
+    return _coconut_tail_call((sorted), [name[:-len('.json')] for name in names if name.endswith('.json') and name.startswith(prefix)])
+
+
+def verify_command(args  # type: list
+    ):
+# type: (...) -> int
+    """Verify every registered job, or those whose id starts with the given prefix."""
+    if len(args) > 1:
+        (error)("Usage: verify [job id prefix]")
+        return 1
+    keys = registered_jobs(args[0] if args else '')
+    if not keys:
+        (error)("No registered jobs in {_coconut_format_0} match {_coconut_format_1!r}".format(_coconut_format_0=(state_dir), _coconut_format_1=((args or [''])[0])))
+        return 1
+    problems = 0
+    for key in keys:
+        spec = load_job_spec(key)
+        with job_options(spec['options']):
+            if store_backend == 'dedup':
+                (log)("Skipping {_coconut_format_0}: jobs in the dedup store are not verified".format(_coconut_format_0=(spec['path'])))
+                continue
+            for member_key, path, rsync_args in spec_jobs(key, spec):
+                problems += verify_job(path, rsync_args, member_key)
+    return 1 if problems else 0
+
+
+def recent_throughput(destination,  # type: str
+     key  # type: str
+    ):
+    """Bytes per second of recent successful runs into destination, falling back to the job's own runs, or None."""
+    with history_db() as db:
+        for column, value in (('destination', destination), ('job', key)):
+            sent, seconds = db.execute('SELECT SUM(bytes_transferred), SUM(finished - started) FROM (SELECT bytes_transferred, started, finished FROM runs' ' WHERE ' + column + ' = ? AND exit_code = 0 AND bytes_transferred > 0 ORDER BY started DESC LIMIT ?)', (value, throughput_window)).fetchone()
+            if sent and seconds:
+                return sent / seconds
+    return None
+
+
+def estimate_job(path,  # type: str
+     rsync_args  # type: list
+    ):
+# type: (...) -> tuple
+    """Dry-run a job against its destination and return (result, seconds the dry run took)."""
+    dest = rsync_args[-1]
+# A snapshot job sends what changed since the newest snapshot
+    previous = list_snapshots(dest) if snapshot_mode and not is_remote(dest) else []
+    dest = join(dest, previous[0]) if previous else dest
+    started = time.time()
+    result = run_rsync(path, rsync_args[:-2] + ['--dry-run', rsync_args[-2], dest])
+    return result._replace(rsync_args=rsync_args), time.time() - started
+
+
+def estimate_command(args  # type: list
+    ):
+# type: (...) -> int
+    """Dry-run paths, or every registered job, and predict the bytes and time each sync needs.
+
+  The prediction is the bytes to transfer over the recent throughput into the
+  same destination, and never less than the dry run itself took to scan.
+  """
+    if args:
+        problem = option_error()
+        if problem:
+            (error)(problem)
+            return 1
+        missing = [path for path in args if not exists(path)]
+        if missing:
+            (error)("{_coconut_format_0} does not exist!".format(_coconut_format_0=(', '.join(missing))))
+            return 1
+        groups = [({}, [(path, build_rsync_args(path)) for path in args])]
+    else:
+        keys = registered_jobs()
+        if not keys:
+            (error)("No registered jobs in {_coconut_format_0}".format(_coconut_format_0=(state_dir)))
+            return 1
+# Jobs registered with the same options are dry-run together
+        by_options = {}
+        for key in keys:
+            spec = load_job_spec(key)
+            group = by_options.setdefault(json.dumps(spec['options'], sort_keys=True), (spec['options'], []))[1]
+            group.extend(((path, rsync_args) for _, path, rsync_args in spec_jobs(key, spec)))
+        groups = list(by_options.values())
+    from concurrent.futures import ThreadPoolExecutor
+    failures = 0
+    totals = {'files': 0, 'bytes': 0, 'seconds': 0.0, 'unknown': 0}
+    (print)("job\tpath\tfiles\tbytes\tbytes/sec\tpredicted secs")
+    for options, jobs in groups:
+        with job_options(options):
+            with remote_session():
+                if store_backend == 'dedup':
+                    for path, _ in jobs:
+                        (log)("Skipping {_coconut_format_0}: jobs in the dedup store cannot be dry-run".format(_coconut_format_0=(path)))
+                    continue
+                with ThreadPoolExecutor(max_workers=max(max_jobs, 1)) as pool:
+                    estimates = (list)(pool.map(lambda job: estimate_job(*job), jobs))
+        for result, scan_seconds in estimates:
+            if result.returncode:
+                (error)("Dry run failed for {_coconut_format_0} (exit {_coconut_format_1}): {_coconut_format_2}".format(_coconut_format_0=(result.path), _coconut_format_1=(result.returncode), _coconut_format_2=(result.output)))
+                failures += 1
+                continue
+            key = job_id(result.rsync_args)
+            files = (lambda _coconut_none_coalesce_item: 0 if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(result.stats.get('number_of_regular_files_transferred'))
+            size = (lambda _coconut_none_coalesce_item: 0 if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(result.stats.get('total_transferred_file_size'))
+            rate = recent_throughput(destination_dir(result.rsync_args), key)
+            seconds = None if rate is None and size else max(size / rate if size else 0, scan_seconds)
+            totals['files'] += files
+            totals['bytes'] += size
+            if seconds is None:
+                totals['unknown'] += 1
+            else:
+                totals['seconds'] += seconds
+            (print)(("\t".join)(map(str, (key[:12], result.path, files, size, '-' if rate is None else "{_coconut_format_0:.0f}".format(_coconut_format_0=(rate)), '-' if seconds is None else "{_coconut_format_0:.1f}".format(_coconut_format_0=(seconds)),))))
+    (print)(("\t".join)(map(str, ('total', '', totals['files'], totals['bytes'], '', "{_coconut_format_0:.1f}".format(_coconut_format_0=(totals['seconds']))))))
+    if totals['unknown']:
+        (log)("{_coconut_format_0} jobs have no recorded throughput and are left out of the total time".format(_coconut_format_0=(totals['unknown'])))
+    return 1 if failures else 0
+
+
+def reconcile_command(args  # type: list
+    ):
+# type: (...) -> int
+    """Add, update and remove cron entries so they match the jobs in a config file."""
+    path = args[0] if args else config_path
+    if len(args) > 1 or not path:
+        (error)("Usage: reconcile <config file>")
+        return 1
+    try:
+        desired = load_config(path)
+    except (OSError, ValueError) as e:
+        (error)("Cannot load {_coconut_format_0}: {_coconut_format_1}".format(_coconut_format_0=(path), _coconut_format_1=(e)))
+        return 1
+    from crontab import CronSlices
+    invalid = [source for source, schedule, _, _ in desired.values() if not CronSlices.is_valid(schedule)]
+    if invalid:
+        (error)("Invalid schedule for {_coconut_format_0}".format(_coconut_format_0=(', '.join(invalid))))
+        return 1
+# Jobs are staggered against the others sharing their schedule
+    groups = {}
+    for key, (_, schedule, spec, stagger) in desired.items():
+        stagger and groups.setdefault(schedule, {}).__setitem__(key, job_devices(spec))
+    schedules = {}
+    for schedule, group in groups.items():
+        schedules.update(stagger_schedules(schedule, group))
+    user_cron = load_crontab()
+    by_comment, _ = index_cron(user_cron)
+    counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+# Entries of jobs the daemon now starts
+    moved = []
+    for key, (source, schedule, spec, _) in desired.items():
+        schedule = schedules.get(key, schedule)
+        spec = dict(spec, schedule=schedule)
+        cmd = job_command(key)
+        job = by_comment.get(key)
+        if spec['options']['scheduler_mode'] == 'daemon':
+            saved = load_job_spec(key)
+            if job is None and saved == spec:
+                counts['unchanged'] += 1
+                continue
+            action = 'added' if job is None and saved is None else 'updated'
+            job and moved.append(job)
+            save_job_spec(key, spec)
+            (log)("{_coconut_format_0} {_coconut_format_1} ({_coconut_format_2}, daemon)".format(_coconut_format_0=(action.capitalize()), _coconut_format_1=(source), _coconut_format_2=(schedule)))
+            counts[action] += 1
+            continue
+        if job is None:
+            job = (user_cron.new)(**{'command': cmd, 'comment': key})
+            action = 'added'
+        elif job.command != cmd or job.slices.render() != CronSlices(schedule).render() or not job.is_enabled() or load_job_spec(key) != spec:
+# Changed entries are edited in place, keeping their position in the crontab
+            action = 'updated'
+        else:
+            counts['unchanged'] += 1
+            continue
+        job.set_command(cmd)
+        job.setall(schedule)
+        job.enable()
+        save_job_spec(key, spec)
+        (log)("{_coconut_format_0} {_coconut_format_1} ({_coconut_format_2})".format(_coconut_format_0=(action.capitalize()), _coconut_format_1=(source), _coconut_format_2=(schedule)))
+        counts[action] += 1
+# Entries running one of our jobs that the config no longer lists; anything else is left alone
+    stale = [job for key, job in by_comment.items() if key not in desired and job.command == job_command(key)]
+    for job in stale:
+        (log)("Removed {_coconut_format_0} ({_coconut_format_1})".format(_coconut_format_0=(job.comment), _coconut_format_1=(job.slices)))
+        remove_job_spec(job.comment)
+    remove_cron_jobs(user_cron, stale + moved)
+    counts['removed'] = len(stale)
+    for key in registered_jobs():
+        spec = load_job_spec(key)
+        if key not in desired and spec and spec['options'].get('scheduler_mode') == 'daemon':
+            (log)("Removed {_coconut_format_0} ({_coconut_format_1}, daemon)".format(_coconut_format_0=(key), _coconut_format_1=(spec.get('schedule'))))
+            remove_job_spec(key)
+            counts['removed'] += 1
+    if counts['added'] or counts['updated'] or counts['removed']:
+        user_cron.write()
+    (print)((", ".join)(["{_coconut_format_0} {_coconut_format_1}".format(_coconut_format_0=(n), _coconut_format_1=(action)) for action, n in counts.items()]))
+    return 0
+
+
+def cron_matcher(schedule  # type: str
+    ):
+    """A function telling whether a local datetime falls on one of schedule's minutes."""
+    from crontab import CronSlices
+    slices = CronSlices((lambda _coconut_none_coalesce_item: schedule if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(cron_specials.get(schedule)))
+    minutes, hours, days, months, weekdays = [_coconut.set((int(v) for v in s)) for s in slices]
+# As in cron, when both day fields are restricted a day matching either one will do
+    either_day = slices[2].render() != '*' and slices[4].render() != '*'
+    def matches(t  # type: datetime
+    ):
+# type: (...) -> bool
+        if t.minute not in minutes or t.hour not in hours or t.month not in months:
+            return False
+        day, weekday = t.day in days, (t.weekday() + 1) % 7 in weekdays
+        return (day or weekday) if either_day else (day and weekday)
+    return matches
+
+
+def daemon_jobs():
+# type: (...) -> dict
+    """{job id: schedule} of every job registered for the daemon."""
+    jobs = {}
+    for key in registered_jobs():
+        spec = load_job_spec(key)
+        if spec and spec['options'].get('scheduler_mode') == 'daemon' and spec.get('schedule'):
+            jobs[key] = spec['schedule']
+    return jobs
+
+
+def dispatch_order(keys,  # type: Iterable
+     now  # type: float
+    ):
+# type: (...) -> list
+    """Order waiting jobs by response ratio, highest first.
+
+  The ratio is (seconds since the last success + expected duration) / expected
+  duration: the longer a job has gone without a backup the sooner it runs,
+  and of two jobs equally overdue the cheaper one goes first. Jobs that never
+  succeeded come before all others.
+  """
+    import heapq
+    keys = list(keys)
+    with history_db() as db:
+        last_success = (dict)(db.execute('SELECT job, MAX(finished) FROM runs WHERE exit_code = 0 GROUP BY job').fetchall())
+    durations = typical_durations(keys)
+    queue = []
+    for key in keys:
+        cost = max(durations.get(key, daemon_default_cost), 1)
+        ratio = (now - last_success[key] + cost) / cost if key in last_success else float('inf')
+        heapq.heappush(queue, (-ratio, cost, key))
+    return [heapq.heappop(queue)[2] for _ in range(len(queue))]
+
+
+def signal_group(pgid,  # type: int
+     sig  # type: int
+    ):
+    """Signal a process group, which may already be gone."""
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def daemon_command(args  # type: list
+    ):
+# type: (...) -> int
+    """Start jobs registered with --scheduler daemon when their schedules fall due.
+
+  Due jobs wait in a queue ordered by dispatch_order and at most max_jobs run
+  at once, each as the same `run <job id>` cron would start. A job that is
+  still running or waiting when it falls due again is not queued twice.
+  Registrations are re-read every minute.
+  """
+    if args:
+        (error)("Usage: daemon")
+        return 1
+    os.makedirs(state_dir, exist_ok=True)
+    daemon_lock = open(join(state_dir, 'daemon.lock'), 'a+')
+    if not try_flock(daemon_lock):
+        (error)("A daemon is already running for {_coconut_format_0}".format(_coconut_format_0=(state_dir)))
+        return 1
+    stopping = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, _: stopping.append(signum))
+    matchers = {}
+    running = {}
+    waiting = set()
+    last_tick = datetime.now().replace(second=0, microsecond=0)
+    (log)("Daemon started for {_coconut_format_0}, up to {_coconut_format_1} jobs at once".format(_coconut_format_0=(state_dir), _coconut_format_1=(max(max_jobs, 1))))
+    while not stopping:
+        now = datetime.now().replace(second=0, microsecond=0)
+        if now > last_tick:
+            missed = min(int((now - last_tick).total_seconds() // 60), daemon_catch_up_minutes)
+            ticks = [now - timedelta(minutes=n) for n in range(missed)]
+            for key, schedule in daemon_jobs().items():
+                if schedule not in matchers:
+                    try:
+                        matchers[schedule] = cron_matcher(schedule)
+                    except (ValueError, KeyError) as e:
+                        (error)("Invalid schedule {_coconut_format_0!r}: {_coconut_format_1}".format(_coconut_format_0=(schedule), _coconut_format_1=(e)))
+                        matchers[schedule] = lambda t: False
+                if not any((matchers[schedule](t) for t in ticks)):
+                    continue
+                if key in running or key in waiting:
+                    short_key = key[:12]
+                    (log)("{_coconut_format_0} is due but still {_coconut_format_1}".format(_coconut_format_0=(short_key), _coconut_format_1=('running' if key in running else 'waiting')))
+                else:
+                    waiting.add(key)
+            last_tick = now
+        for key, proc in list(running.items()):
+            if proc.poll() is not None:
+                short_key = key[:12]
+                ((log if proc.returncode else debug))("{_coconut_format_0} finished (exit {_coconut_format_1})".format(_coconut_format_0=(short_key), _coconut_format_1=(proc.returncode)))
+                del running[key]
+        free = max(max_jobs, 1) - len(running)
+        if waiting and free > 0:
+            for key in dispatch_order(waiting, time.time())[:free]:
+                waiting.discard(key)
+                short_key = key[:12]
+                (debug)("Starting {_coconut_format_0}".format(_coconut_format_0=(short_key)))
+# Each run leads its own process group, so it and its rsync can be signalled together
+                running[key] = subprocess.Popen(shlex.split(job_command(key)), start_new_session=True)
+        time.sleep(daemon_poll_seconds)
+    (log)("Stopping, {_coconut_format_0} jobs still running".format(_coconut_format_0=(len(running))))
+    for proc in running.values():
+        signal_group(proc.pid, signal.SIGTERM)
+    deadline = time.monotonic() + kill_grace_seconds
+    for proc in running.values():
+        try:
+            proc.wait(max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            pass
+        signal_group(proc.pid, signal.SIGKILL)
+    daemon_lock.close()
+    return 0
+
+
+subcommands = {'history': history_command, 'run': run_command, 'restore': restore_command, 'verify': verify_command, 'estimate': estimate_command, 'reconcile': reconcile_command, 'daemon': daemon_command}
+
+
+def index_cron(user_cron  # type: CronTab
+    ):
+# type: (...) -> tuple
+    """Index existing cron jobs by fingerprint comment and by command in one pass."""
+    by_comment = {}
+    by_command = {}
+    for job in user_cron:
+        by_comment.setdefault(job.comment, job)
+        by_command.setdefault(job.command, job)
+    return by_comment, by_command
+
+
+@traced('crontab load')
+@_coconut_tco
+def load_crontab():
+# type: (...) -> CronTab
+    """Load the crontab jobs are registered in."""
+    from crontab import CronTab
+    if not crontab_file:
+        return _coconut_tail_call(CronTab, user=True)
+# A crontab file that does not exist yet is an empty one
+    exists(crontab_file) or open(crontab_file, 'a').close()
+    return _coconut_tail_call(CronTab, tabfile=crontab_file)
+
+
+def remove_cron_jobs(user_cron,  # type: CronTab
+     doomed  # type: list
+    ):
+    """Remove many cron entries in one pass over the crontab.
+
+  CronTab.remove() finds every entry by value, which makes bulk removal
+  quadratic. Blank lines after a removed entry go with it, and variables set
+  before it (MAILTO=...) pass to the next entry that is kept.
+  """
+    from crontab import CronItem
+    doomed_ids = _coconut.set((id(job) for job in doomed))
+    lines = []
+    carry = None
+    dropping = False
+    for line in user_cron.lines:
+        if id(line) in doomed_ids:
+            if carry is None:
+                carry = line.env
+            else:
+                carry.update(line.env)
+            dropping = True
+            continue
+        if dropping and line == '':
+            continue
+        dropping = False
+        if isinstance(line, CronItem) and carry is not None:
+            env = line.env
+            line.env = carry
+            line.env.update(env)
+            line.env.job = line
+            carry = None
+        lines.append(line)
+    user_cron.lines[:] = lines
+    user_cron.crons[:] = [job for job in user_cron.crons if id(job) not in doomed_ids]
+
+
+@_coconut_tco
+def job_devices(spec  # type: dict
+    ):
+# type: (...) -> set
+    """The block devices a job reads from and writes to."""
+    return _coconut_tail_call(_coconut.set, (device_key(p) for _, path, rsync_args in spec_jobs(None, spec) for p in (path, rsync_args[-1]) if not is_remote(p)))
+
+
+def typical_durations(keys  # type: list
+    ):
+# type: (...) -> dict
+    """Mean duration in seconds of each job's recent successful runs, for jobs with any."""
+    durations = {}
+    with history_db() as db:
+        for key in keys:
+            rows = db.execute('SELECT finished - started FROM runs WHERE job = ? AND exit_code = 0 ORDER BY started DESC LIMIT ?', (key, history_trend_window)).fetchall()
+            if rows:
+                durations[key] = mean([d for d, in rows])
+    return durations
+
+
+@_coconut_tco
+def stagger_schedules(schedule,  # type: str
+     jobs,  # type: dict
+     placed={}  # type: dict
+    ):
+# type: (...) -> dict
+    """Spread the start minute of jobs sharing a schedule across its interval.
+
+  jobs maps job id -> the devices it touches. Each job's start is picked from
+  its id, then moved to the next minute where it does not overlap, for its
+  typical duration, a job already placed on one of its devices. placed maps
+  the ids of jobs registered earlier to (their schedule, their devices); those
+  that are a staggered form of the same schedule keep their minutes. Returns
+  {job id: schedule}; schedules whose minute field is a list or range, or
+  that fire every minute, are left as they are.
+  """
+    fields = ((lambda _coconut_none_coalesce_item: schedule if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(cron_specials.get(schedule))).split()
+    if len(fields) != 5:
+        return _coconut_tail_call(dict.fromkeys, jobs, schedule)
+    minute, rest = fields[0], " ".join(fields[1:])
+    step = re.match(r'^\*/(\d+)$', minute)
+    if step and 60 % int(step.group(1)) == 0 and int(step.group(1)) > 1:
+        period = int(step.group(1))
+        render = lambda o: "{_coconut_format_0}-59/{_coconut_format_1} {_coconut_format_2}".format(_coconut_format_0=(o), _coconut_format_1=(period), _coconut_format_2=(rest)) if o else "{_coconut_format_0} {_coconut_format_1}".format(_coconut_format_0=(minute), _coconut_format_1=(rest))
+    elif minute.isdigit():
+        period = 60
+        render = lambda o: "{_coconut_format_0} {_coconut_format_1}".format(_coconut_format_0=((int(minute) + o) % 60), _coconut_format_1=(rest))
+    else:
+        (debug)(*("Not staggering {_coconut_format_0!r}".format(_coconut_format_0=(schedule)), 2))
+        return _coconut_tail_call(dict.fromkeys, jobs, schedule)
+# The offset render gave another job's schedule, or None if it is not a form of this one
+    def offset_of(other  # type: str
+    ):
+        other_fields = ((lambda _coconut_none_coalesce_item: other if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(cron_specials.get(other))).split()
+        if len(other_fields) != 5 or " ".join(other_fields[1:]) != rest:
+            return None
+        if step:
+            m = re.match(r'^(?:\*|(\d+)-59)/' + str(period) + '$', other_fields[0])
+            return int(m.group(1) or 0) if m else None
+        return (int(other_fields[0]) - int(minute)) % 60 if other_fields[0].isdigit() else None
+    others = {}
+    for key, (other, devices) in placed.items():
+        offset = offset_of(other)
+        if key not in jobs and offset is not None:
+            others[key] = (offset, devices)
+    durations = typical_durations(list(jobs) + list(others))
+# Whole minutes each run occupies; unknown jobs are assumed to fit in one
+    minutes = lambda key: min(max(1, -(-int(durations.get(key, 0)) // 60)), period)
+    busy = {}
+    for key, (offset, devices) in others.items():
+        for dev in devices:
+            busy.setdefault(dev, set()).update(((offset + i) % period for i in range(minutes(key))))
+    staggered = {}
+# Longest first, so the short runs fill the gaps between them
+    for key in sorted(jobs, key=lambda k: (-minutes(k), k)):
+        preferred = int(key[:8], 16) % period
+        claimed = lambda o: _coconut.set(((o + i) % period for i in range(minutes(key))))
+        free = lambda o: not any((claimed(o) & busy.get(dev, set()) for dev in jobs[key]))
+        offset = next((filter(free, map(lambda i: (preferred + i) % period, range(period)))), preferred)
+        for dev in jobs[key]:
+            busy.setdefault(dev, set()).update(claimed(offset))
+        staggered[key] = render(offset)
+        (debug)(*("Job {_coconut_format_0} starts {_coconut_format_1} min into every {_coconut_format_2} min".format(_coconut_format_0=(key), _coconut_format_1=(offset), _coconut_format_2=(period)), 2))
+    return staggered
+
+
+def register_cron_jobs(jobs,  # type: list
+     on_create=None, schedules={},  # type: dict
+     replaces={}  # type: dict
+    ):
+    """Add a cron job per (job id, command), loading and writing the crontab once.
+
+  on_create is called with the id of every job about to be written. A job
+  gets its schedule from schedules, or cron_slices_str. replaces maps job
+  ids to the comments or commands of entries the job takes over, such as
+  the unlocked rsync of older versions or the paths now in a batch; those
+  are always removed.
+  """
+    user_cron = load_crontab()
+    (debug)(*("Existing cron jobs: {_coconut_format_0}".format(_coconut_format_0=(repr(user_cron.crons))), 2))
+    with span('crontab index'):
+        by_comment, by_command = index_cron(user_cron)
+    changed = False
+# Replaced and invalid entries, dropped together: CronTab.remove() scans the whole crontab per entry
+    doomed = []
+    replaced = set()
+    for key, cmd in jobs:
+        for old in replaces.get(key, ()):
+            old_job = (lambda _coconut_none_coalesce_item: by_command.get(old) if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(by_comment.get(old))
+            if old_job and id(old_job) not in replaced:
+                (log)("Replacing cron entry: {_coconut_format_0}".format(_coconut_format_0=(old_job.command)))
+                replaced.add(id(old_job))
+                doomed.append(old_job)
+                changed = True
+# If task already exists
+        job = (lambda _coconut_none_coalesce_item: by_command.get(cmd) if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(by_comment.get(key))
+        if job:
+            if cron_force:
+                (debug)("Cron job already exists... DELETING {_coconut_format_0})".format(_coconut_format_0=(job.comment)))
+                doomed.append(job)
+                changed = True
+            else:
+                (error)("Cron job already exists for {_coconut_format_0}!".format(_coconut_format_0=(cmd)))
+                continue
+        job = (user_cron.new)(**{'command': cmd, 'comment': key})
+        job.setall(schedules.get(key, cron_slices_str))
+        if not job.is_valid():
+            (error)("Cannot create cron job!: {_coconut_format_0}".format(_coconut_format_0=(repr(job))))
+            doomed.append(job)
+        else:
+            (debug)("Creating cron job: {_coconut_format_0}".format(_coconut_format_0=(job)))
+            by_comment[job.comment] = by_command[cmd] = job
+            on_create and on_create(key)
+            changed = True
+    doomed and remove_cron_jobs(user_cron, doomed)
+    if changed:
+        with span('crontab write'):
+            user_cron.write()
+
+
+def register_daemon_jobs(specs,  # type: dict
+     replaces={}  # type: dict
+    ):
+    """Save job specs for the daemon to start.
+
+  Crontab lines left by an earlier cron registration of the same jobs, or
+  matching a comment or command in replaces, are removed so they do not run
+  twice.
+  """
+    from crontab import CronSlices
+    saved = set()
+    for key, spec in specs.items():
+        if not CronSlices.is_valid((lambda _coconut_none_coalesce_item: spec['schedule'] if _coconut_none_coalesce_item is None else _coconut_none_coalesce_item)(cron_specials.get(spec['schedule']))):
+            (error)("Invalid schedule {_coconut_format_0!r} for {_coconut_format_1}".format(_coconut_format_0=(spec['schedule']), _coconut_format_1=(spec['path'])))
+            continue
+        existing = load_job_spec(key)
+        if existing and existing != spec and not cron_force:
+            (error)("Job already registered for {_coconut_format_0}!".format(_coconut_format_0=(spec['path'])))
+            continue
+        save_job_spec(key, spec)
+        saved.add(key)
+        (debug)("Registered {_coconut_format_0} ({_coconut_format_1}) for the daemon".format(_coconut_format_0=(spec['path']), _coconut_format_1=(spec['schedule'])))
+    if not saved:
+        return
+    user_cron = load_crontab()
+    olds = _coconut.set((old for key in saved for old in replaces.get(key, ())))
+    doomed = [job for job in user_cron if job.comment in saved or job.comment in olds or job.command in olds]
+    if doomed:
+        remove_cron_jobs(user_cron, doomed)
+        with span('crontab write'):
+            user_cron.write()
+
+
+def main(argv=None  # type: list
+    ):
+# type: (...) -> int
+    started = time.perf_counter()
+# Remove file name from args
+    args = (list)((reversed)((list)(takewhile(lambda x: file_no_ext(x) != file_no_ext(__file__), reversed((sys.argv if argv is None else argv))))))
+# Remove boolean flags from args
+    args = (parse_boolean_args)(args)
+# A leading subcommand takes the remaining positional args instead of paths
+    command = args.pop(0) if args and args[0] in subcommands else None
+# Group args in pairs, parse args and remove any options from the args
+    paths_to_backup = (list)(filter(lambda x: x if not parse_arg(x) else None, groupsof(2, args)))
+# Flatten (the paths will still be grouped)
+    paths_to_backup = [path for paths in paths_to_backup for path in paths]
+# Or after the options (back up a path that clashes with one as ./<name>)
+    if not command and paths_to_backup and paths_to_backup[0] in subcommands:
+        command = paths_to_backup.pop(0)
+
+    with profiling(started):
+        with span(command or 'backup'):
+            return subcommands[command](paths_to_backup) if command else backup(paths_to_backup)
+
+
+def backup(paths_to_backup  # type: list
+    ):
+# type: (...) -> int
+    """Sync paths into out_path, then register them with cron when asked to."""
+    (debug)(*('paths_to_backup: ' + repr(paths_to_backup), 2))
+    (debug)(*('output: {_coconut_format_0}'.format(_coconut_format_0=(out_path)), 2))
+    (debug)(*('force: {_coconut_format_0}'.format(_coconut_format_0=(cron_force)), 2))
+    (debug)(*('cron: {_coconut_format_0}'.format(_coconut_format_0=(cron_slices_str)), 2))
+    (debug)(*('jobs: {_coconut_format_0}, per device: {_coconut_format_1}'.format(_coconut_format_0=(max_jobs), _coconut_format_1=(per_device_limit)), 2))
+    (debug)(*('transfer profile: {_coconut_format_0}'.format(_coconut_format_0=(transfer_profile)), 2))
+    snapshot_mode and (debug)(*('snapshot retention: {_coconut_format_0}'.format(_coconut_format_0=(snapshot_keep)), 2))
+    problem = option_error()
+    if problem:
+        (error)(problem)
+        return 1
+    lower_priority()
+
+    with remote_session():
+# Create the output directory if needed
+        if not make_output_dir():
+            return 1
+
+        failures = 0
+        jobs = []
+        with span('build args'):
+            for path in paths_to_backup:
+                if not exists(path):
+                    (error)("{_coconut_format_0} does not exist!".format(_coconut_format_0=(path)))
+                    failures += 1
+                    continue
+                jobs.append((path, build_rsync_args(path)))
+
+        singles, batches = batch_jobs(jobs) if batch_mode else (jobs, [])
+        with span('syncs'):
+            synced, sync_failures = run_syncs(singles, batches=batches)
+        failures += sync_failures
+        if verify_mode and store_backend != 'dedup':
+            for r in synced:
+                if r.output != 'skipped' and verify_job(r.path, r.rsync_args, job_id(r.rsync_args)):
+                    failures += 1
+# Keep cron registration in command-line order regardless of completion order
+        synced = sorted(synced, key=lambda r: paths_to_backup.index(r.path))
+
+        if cron_slices_str:
+            with span('register'):
+                specs = dict(((job_id(r.rsync_args)), (job_spec(r.path, r.rsync_args))) for r in synced)
+# Entries each job takes over: the unlocked rsync older versions registered for it
+                replaces = {}
+                for r in synced:
+                    old = legacy_command(r.rsync_args)
+                    replaces[job_id(r.rsync_args)] = [fingerprint(old), old]
+# A batch is registered as one job that syncs its paths with one rsync
+                for batch in batches:
+                    members = [job_id(rsync_args) for _, rsync_args in batch if job_id(rsync_args) in specs]
+                    if len(members) < 2:
+                        continue
+                    key = (fingerprint)((" ".join)((sorted)(members)))
+                    specs[key] = dict(specs[members[0]], batch=[[k, specs[k]['path'], specs[k]['rsync_args']] for k in members])
+                    replaces[key] = [old for k in members for old in [k] + replaces.pop(k)]
+                    for k in members:
+                        del specs[k]
+                        remove_job_spec(k)
+                schedules = {}
+                if stagger_mode:
+# Jobs registered by earlier runs keep their minutes, new ones go around them
+                    placed = {}
+                    for key in registered_jobs():
+                        spec = load_job_spec(key)
+                        if spec and spec.get('schedule'):
+                            placed[key] = (spec['schedule'], job_devices(spec))
+                    schedules = stagger_schedules(cron_slices_str, dict(((key), (job_devices(spec))) for key, spec in specs.items()), placed)
+                for key, spec in specs.items():
+                    spec['schedule'] = schedules.get(key, cron_slices_str)
+                if scheduler_mode == 'daemon':
+                    register_daemon_jobs(specs, replaces)
+                else:
+                    register_cron_jobs([(key, job_command(key)) for key in specs], on_create=lambda key: save_job_spec(key, specs[key]), schedules=schedules, replaces=replaces)
+
+        textfile_path and write_textfile(textfile_path)
+
+        if watch_mode:
+            failures += watch(jobs)
+
+        if failures:
+            (error)("{_coconut_format_0} of {_coconut_format_1} paths failed".format(_coconut_format_0=(failures), _coconut_format_1=(len(paths_to_backup))))
+        return 1 if failures else 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Lean entry point cron uses to run one registered backup job.
+
+Usage: backup_run.py [--state-dir <path>] run <job id>
+
+Kept as plain Python on purpose: running a Coconut-compiled file as a script
+recompiles it and its runtime header on every start, while importing
+backup_cron as a module lets Python reuse its cached bytecode. backup_cron
+itself only imports what a sync needs until registration asks for more.
+"""
+import sys
+
+
+def main(argv=None):
+    import backup_cron
+    return backup_cron.main(['backup_cron.py'] + (sys.argv if argv is None else argv)[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())